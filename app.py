@@ -1,36 +1,123 @@
-from flask import Flask, jsonify, request, render_template
+from flask import Flask, g, jsonify, request, render_template
 from flask.json.provider import DefaultJSONProvider
 from datetime import date, datetime
 from decimal import Decimal
 import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
+import orjson
+from cachetools import TTLCache
 
-class CustomJSONProvider(DefaultJSONProvider):
-    """Custom JSON provider that handles date/datetime/Decimal serialization."""
-    def default(self, obj):
-        if isinstance(obj, (date, datetime)):
-            return obj.isoformat()
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super().default(obj)
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+
+def _orjson_default(obj):
+    """Handle types orjson doesn't serialize natively."""
+    if isinstance(obj, Decimal):
+        return float(obj)
+    if isinstance(obj, sqlite3.Row):
+        return dict(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def json_fragment(value):
+    """Embed JSON text built elsewhere (e.g. by Postgres) without re-encoding it."""
+    return orjson.Fragment(value) if isinstance(value, str) else value
+
+
+def dumps_bytes(obj):
+    """Serialize obj to JSON bytes."""
+    return orjson.dumps(obj, default=_orjson_default, option=orjson.OPT_NON_STR_KEYS)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson (handles date/datetime natively)."""
+
+    def dumps(self, obj, **kwargs):
+        return dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
 
 from config import Config
-from database import init_db, seed_accounts, run_migrations
+from database import (
+    SCHEMA_VERSION, init_db, seed_accounts, run_migrations,
+    get_schema_version, record_schema_version
+)
 import models
 
+try:
+    from sheets_sync import SheetsSync
+except ImportError:  # Google API client not installed
+    SheetsSync = None
+
 app = Flask(__name__)
-app.json_provider_class = CustomJSONProvider
-app.json = CustomJSONProvider(app)
+app.json = OrjsonProvider(app)
 app.config.from_object(Config)
 
+# Allowed values for validated fields; messages list them in display order
+_ACTIVITY_TYPES = ('call', 'email', 'meeting', 'research', 'event_invite', 'internal', 'other')
+_VALID_ACTIVITY_TYPES = frozenset(_ACTIVITY_TYPES)
+_VALID_ACTIVITY_TYPES_MSG = ', '.join(_ACTIVITY_TYPES)
+
+_DEAL_STAGES = ('discovery', 'design', 'proposal', 'negotiation', 'closed_won', 'closed_lost')
+_VALID_DEAL_STAGES = frozenset(_DEAL_STAGES)
+_VALID_DEAL_STAGES_MSG = ', '.join(_DEAL_STAGES)
+
+_CONTACT_ROLES = ('champion', 'decision_maker', 'technical_eval', 'influencer', 'blocker', 'other')
+_VALID_CONTACT_ROLES = frozenset(_CONTACT_ROLES)
+_VALID_CONTACT_ROLES_MSG = ', '.join(_CONTACT_ROLES)
+
 # ============================================================================
 # Initialize Database
 # ============================================================================
 
+_initialized = False
+
+@contextmanager
+def _init_lock():
+    """Hold an exclusive file lock so only one worker initializes at a time."""
+    if fcntl is None:
+        yield
+        return
+    lock_dir = os.path.dirname(Config.DATABASE_PATH)
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, '.init.lock'), 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
 def initialize_app():
-    """Initialize database if it doesn't exist."""
+    """Initialize database if it doesn't exist (once per process)."""
+    global _initialized
+    if _initialized:
+        return
+    with _init_lock():
+        _initialize_database()
+    _initialized = True
+
+def _initialize_database():
+    """Create, seed or migrate the database as needed.
+
+    Databases already at SCHEMA_VERSION are left alone, so warm starts skip
+    the schema DDL entirely.
+    """
     if Config.use_postgres():
         print("Using PostgreSQL database...")
+        if get_schema_version() == SCHEMA_VERSION:
+            return
         init_db()
         seed_accounts()
         run_migrations()
@@ -40,23 +127,83 @@ def initialize_app():
         init_db()
         seed_accounts()
         print("SQLite database initialized with accounts.")
+    elif get_schema_version() == SCHEMA_VERSION:
+        return
     else:
         # Run migrations on existing database
         run_migrations()
 
+    record_schema_version()
+
+@app.cli.command('init-db')
+def init_db_command():
+    """Initialize the database from the command line."""
+    initialize_app()
+
+# ============================================================================
+# Request Helpers
+# ============================================================================
+
+@app.before_request
+def set_request_today():
+    """Resolve today's date once per request so all uses agree."""
+    g.today = Config.today()
+    g.today_iso = g.today.isoformat()
+
+def get_request_json():
+    """Parse the request body with orjson. Returns None if empty or invalid."""
+    body = request.get_data(cache=False)
+    if not body:
+        return None
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+
+# ============================================================================
+# Response Cache
+# ============================================================================
+
+# Serialized bodies for polled read endpoints (account list, dashboard, sync
+# status), keyed by (name, today's date, data generation). Every write made
+# through models bumps the generation, so stale entries are never served;
+# the TTL bounds staleness from writes in other worker processes.
+_response_cache = TTLCache(maxsize=8, ttl=10)
+_response_cache_lock = threading.Lock()
+
+def cached_json_response(name, build_payload):
+    """Serve a JSON response from the short-lived cache, building it on a miss."""
+    key = (name, g.today_iso, models.data_generation())
+    with _response_cache_lock:
+        body = _response_cache.get(key)
+
+    if body is None:
+        body = dumps_bytes(build_payload())
+        with _response_cache_lock:
+            _response_cache[key] = body
+
+    return app.response_class(body, mimetype='application/json')
+
 # ============================================================================
 # Main Routes
 # ============================================================================
 
+_index_html = None
+
 @app.route('/')
 def index():
-    """Serve the main SPA page."""
-    return render_template('index.html')
+    """Serve the main SPA page (rendered once; re-rendered in debug mode)."""
+    global _index_html
+    if _index_html is None or app.debug:
+        _index_html = render_template('index.html').encode('utf-8')
+    return app.response_class(_index_html, mimetype='text/html')
+
+_HEALTH_BODY = b'{"status":"ok"}'
 
 @app.route('/health')
 def health():
     """Health check endpoint."""
-    return jsonify({'status': 'ok'})
+    return app.response_class(_HEALTH_BODY, mimetype='application/json')
 
 # ============================================================================
 # Account API Routes
@@ -65,24 +212,25 @@ def health():
 @app.route('/api/accounts', methods=['GET'])
 def get_accounts():
     """Get all accounts with today's status and stats."""
-    accounts = models.get_all_accounts()
-
-    touched_count = sum(1 for a in accounts if a['touched_today'])
-    total_count = len(accounts)
-
-    return jsonify({
-        'accounts': accounts,
-        'summary': {
-            'total': total_count,
-            'touched_today': touched_count,
-            'untouched_today': total_count - touched_count
+    def build_payload():
+        accounts, touched_count, total_count = models.get_accounts_with_summary(
+            g.today_iso, as_json=True
+        )
+        return {
+            'accounts': json_fragment(accounts),
+            'summary': {
+                'total': total_count,
+                'touched_today': touched_count,
+                'untouched_today': total_count - touched_count
+            }
         }
-    })
+
+    return cached_json_response('accounts', build_payload)
 
 @app.route('/api/accounts/<int:account_id>', methods=['GET'])
 def get_account(account_id):
     """Get single account with full details."""
-    account = models.get_account(account_id)
+    account = models.get_account(account_id, g.today_iso)
 
     if not account:
         return jsonify({'error': 'Account not found'}), 404
@@ -92,7 +240,7 @@ def get_account(account_id):
 @app.route('/api/accounts/<int:account_id>', methods=['PUT'])
 def update_account(account_id):
     """Update account metadata (industry, location, renewal_date, annual_value)."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -117,7 +265,7 @@ def update_account(account_id):
 @app.route('/api/accounts/<int:account_id>/snooze', methods=['POST'])
 def snooze_account(account_id):
     """Snooze an account for today - marks as touched without logging activity."""
-    models.mark_touched(account_id)
+    models.mark_touched(account_id, g.today_iso)
     return jsonify({'message': 'Account snoozed for today'}), 200
 
 # ============================================================================
@@ -127,7 +275,7 @@ def snooze_account(account_id):
 @app.route('/api/activities', methods=['POST'])
 def create_activity():
     """Create a new activity."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -135,14 +283,13 @@ def create_activity():
     account_id = data.get('account_id')
     activity_type = data.get('activity_type')
     description = data.get('description')
-    activity_date = data.get('activity_date', Config.today().isoformat())
+    activity_date = data.get('activity_date', g.today_iso)
 
     if not account_id or not activity_type or not description:
         return jsonify({'error': 'account_id, activity_type, and description are required'}), 400
 
-    valid_types = ['call', 'email', 'meeting', 'research', 'event_invite', 'internal', 'other']
-    if activity_type not in valid_types:
-        return jsonify({'error': f'activity_type must be one of: {", ".join(valid_types)}'}), 400
+    if activity_type not in _VALID_ACTIVITY_TYPES:
+        return jsonify({'error': f'activity_type must be one of: {_VALID_ACTIVITY_TYPES_MSG}'}), 400
 
     activity_id = models.create_activity(account_id, activity_type, description, activity_date)
 
@@ -151,15 +298,76 @@ def create_activity():
         'message': 'Activity logged successfully'
     }), 201
 
-@app.route('/api/accounts/<int:account_id>/activities', methods=['GET'])
-def get_account_activities(account_id):
-    """Get activities for an account."""
-    limit = request.args.get('limit', 50, type=int)
-    offset = request.args.get('offset', 0, type=int)
+@app.route('/api/activities/bulk', methods=['POST'])
+def create_activities_bulk():
+    """Create many activities at once (e.g. an import) in one transaction."""
+    data = get_request_json()
+    activities = data.get('activities') if isinstance(data, dict) else None
+
+    if not activities or not isinstance(activities, list):
+        return jsonify({'error': 'activities must be a non-empty list'}), 400
+
+    rows = []
+    for index, activity in enumerate(activities):
+        if not isinstance(activity, dict):
+            return jsonify({'error': f'activities[{index}] must be an object'}), 400
+
+        account_id = activity.get('account_id')
+        activity_type = activity.get('activity_type')
+        description = activity.get('description')
+
+        if not account_id or not activity_type or not description:
+            return jsonify({'error': f'activities[{index}]: account_id, activity_type, and description are required'}), 400
+
+        if activity_type not in _VALID_ACTIVITY_TYPES:
+            return jsonify({'error': f'activities[{index}]: activity_type must be one of: {_VALID_ACTIVITY_TYPES_MSG}'}), 400
 
-    activities = models.get_account_activities(account_id, limit, offset)
+        rows.append((account_id, activity_type, description, activity.get('activity_date', g.today_iso)))
 
-    return jsonify({'activities': activities})
+    created = models.create_activities_bulk(rows)
+
+    return jsonify({
+        'created': created,
+        'message': 'Activities logged successfully'
+    }), 201
+
+@app.route('/api/accounts/<int:account_id>/activities', methods=['GET'])
+def get_account_activities(account_id):
+    """Get activities for an account (streamed in batches).
+
+    Pass after_date, after_created_at and after_id from the last activity of
+    the previous page to fetch the next one, or limit=all for every activity.
+    """
+    # Validate everything up front: once streaming starts the 200 is already sent
+    if request.args.get('limit') == 'all':
+        limit = None  # limit=all streams every activity
+    else:
+        limit = request.args.get('limit', 50, type=int)
+        if limit < 0:
+            return jsonify({'error': 'limit must not be negative'}), 400
+    after = None
+    after_id = request.args.get('after_id', type=int)
+    if after_id is not None:
+        after_date = request.args.get('after_date')
+        after_created_at = request.args.get('after_created_at')
+        if not after_date or not after_created_at:
+            return jsonify({'error': 'after_date and after_created_at are required with after_id'}), 400
+        try:
+            date.fromisoformat(after_date)
+            datetime.fromisoformat(after_created_at)
+        except ValueError:
+            return jsonify({'error': 'after_date and after_created_at must be ISO dates'}), 400
+        after = (after_date, after_created_at, after_id)
+
+    def generate():
+        yield b'{"activities":['
+        separator = b''
+        for batch in models.iter_account_activities(account_id, limit, after):
+            yield separator + b','.join(dumps_bytes(activity) for activity in batch)
+            separator = b','
+        yield b']}'
+
+    return app.response_class(generate(), mimetype='application/json')
 
 # ============================================================================
 # Task API Routes
@@ -168,7 +376,7 @@ def get_account_activities(account_id):
 @app.route('/api/tasks', methods=['POST'])
 def create_task():
     """Create a new task."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -191,7 +399,7 @@ def create_task():
 @app.route('/api/tasks/<int:task_id>', methods=['PUT'])
 def update_task(task_id):
     """Update a task."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -228,14 +436,14 @@ def get_account_tasks(account_id):
 @app.route('/api/notes', methods=['POST'])
 def create_note():
     """Create a new note."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
     account_id = data.get('account_id')
     content = data.get('content')
-    note_date = data.get('note_date', Config.today().isoformat())
+    note_date = data.get('note_date', g.today_iso)
 
     if not account_id or not content:
         return jsonify({'error': 'account_id and content are required'}), 400
@@ -260,7 +468,7 @@ def get_account_notes(account_id):
 @app.route('/api/deals', methods=['POST'])
 def create_deal():
     """Create a new deal."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -271,10 +479,9 @@ def create_deal():
     if not account_id or not name:
         return jsonify({'error': 'account_id and name are required'}), 400
 
-    valid_stages = ['discovery', 'design', 'proposal', 'negotiation', 'closed_won', 'closed_lost']
     stage = data.get('stage', 'discovery')
-    if stage not in valid_stages:
-        return jsonify({'error': f'stage must be one of: {", ".join(valid_stages)}'}), 400
+    if stage not in _VALID_DEAL_STAGES:
+        return jsonify({'error': f'stage must be one of: {_VALID_DEAL_STAGES_MSG}'}), 400
 
     deal_id = models.create_deal(
         account_id=account_id,
@@ -300,14 +507,13 @@ def get_account_deals(account_id):
 @app.route('/api/deals/<int:deal_id>', methods=['PUT'])
 def update_deal(deal_id):
     """Update a deal."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
 
-    valid_stages = ['discovery', 'design', 'proposal', 'negotiation', 'closed_won', 'closed_lost']
-    if 'stage' in data and data['stage'] not in valid_stages:
-        return jsonify({'error': f'stage must be one of: {", ".join(valid_stages)}'}), 400
+    if 'stage' in data and data['stage'] not in _VALID_DEAL_STAGES:
+        return jsonify({'error': f'stage must be one of: {_VALID_DEAL_STAGES_MSG}'}), 400
 
     result = models.update_deal(
         deal_id,
@@ -337,7 +543,7 @@ def delete_deal(deal_id):
 @app.route('/api/contacts', methods=['POST'])
 def create_contact():
     """Create a new contact."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -348,10 +554,9 @@ def create_contact():
     if not account_id or not name:
         return jsonify({'error': 'account_id and name are required'}), 400
 
-    valid_roles = ['champion', 'decision_maker', 'technical_eval', 'influencer', 'blocker', 'other']
     role = data.get('role')
-    if role and role not in valid_roles:
-        return jsonify({'error': f'role must be one of: {", ".join(valid_roles)}'}), 400
+    if role and role not in _VALID_CONTACT_ROLES:
+        return jsonify({'error': f'role must be one of: {_VALID_CONTACT_ROLES_MSG}'}), 400
 
     contact_id = models.create_contact(
         account_id=account_id,
@@ -377,7 +582,7 @@ def get_account_contacts(account_id):
 @app.route('/api/contacts/<int:contact_id>', methods=['PUT'])
 def update_contact(contact_id):
     """Update a contact."""
-    data = request.get_json()
+    data = get_request_json()
 
     if not data:
         return jsonify({'error': 'No data provided'}), 400
@@ -411,8 +616,27 @@ def delete_contact(contact_id):
 @app.route('/api/dashboard', methods=['GET'])
 def get_dashboard():
     """Get dashboard summary stats."""
-    stats = models.get_dashboard_stats()
-    return jsonify(stats)
+    return cached_json_response('dashboard', lambda: models.get_dashboard_stats(g.today))
+
+@app.route('/api/dashboard/bundle', methods=['GET'])
+def get_dashboard_bundle():
+    """Get accounts, dashboard stats and sync status for a full page load."""
+    def build_payload():
+        accounts, touched_count, total_count, stats, sync_status = models.get_dashboard_bundle(
+            g.today, as_json=True
+        )
+        return {
+            'accounts': json_fragment(accounts),
+            'summary': {
+                'total': total_count,
+                'touched_today': touched_count,
+                'untouched_today': total_count - touched_count
+            },
+            'dashboard': stats,
+            'sync_status': sync_status
+        }
+
+    return cached_json_response('dashboard_bundle', build_payload)
 
 # ============================================================================
 # Sync API Routes
@@ -421,33 +645,95 @@ def get_dashboard():
 @app.route('/api/sync/status', methods=['GET'])
 def get_sync_status():
     """Get count of unsynced items."""
-    status = models.get_sync_status()
-    return jsonify(status)
+    return cached_json_response('sync_status', models.get_sync_status)
 
-@app.route('/api/sync', methods=['POST'])
-def sync_to_sheets():
-    """Sync all unsynced data to Google Sheets."""
-    try:
-        from sheets_sync import SheetsSync
+_sheets_sync = None
 
-        sync = SheetsSync(
+def get_sheets_sync():
+    """Get the shared SheetsSync client, creating it on first use."""
+    global _sheets_sync
+    if _sheets_sync is None:
+        _sheets_sync = SheetsSync(
             Config.GOOGLE_SHEETS_CREDENTIALS_PATH,
             Config.GOOGLE_SHEETS_SPREADSHEET_ID
         )
+    return _sheets_sync
+
+# Only one sync runs at a time across all worker processes: overlapping syncs
+# would append the same unsynced rows twice, and httplib2 (used by the Google
+# API client) isn't thread-safe. Syncs run in the background on one thread.
+_sync_executor = ThreadPoolExecutor(max_workers=1)
+# Without fcntl (Windows dev server, a single process) guard within the process
+_sync_fallback_lock = threading.Lock()
+
+def _try_acquire_sync_lock():
+    """Take the cross-worker sync lock without waiting.
+
+    Returns a callable that releases the lock, or None if a sync holds it.
+    """
+    if fcntl is None:
+        if not _sync_fallback_lock.acquire(blocking=False):
+            return None
+        return _sync_fallback_lock.release
+
+    lock_dir = os.path.dirname(Config.DATABASE_PATH)
+    os.makedirs(lock_dir, exist_ok=True)
+    lock_file = open(os.path.join(lock_dir, '.sync.lock'), 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return None
+    # Closing the file releases the lock (as does the process exiting)
+    return lock_file.close
+
+def _run_sync(release_lock):
+    """Run a full sync, record the outcome, then release the sync lock."""
+    result, error = None, None
+    try:
+        result = get_sheets_sync().full_sync()
+    except Exception as e:
+        error = str(e)
 
-        result = sync.full_sync()
-        return jsonify(result)
+    try:
+        models.record_sync_result(result, error)
+    finally:
+        release_lock()
 
-    except ImportError:
+@app.route('/api/sync', methods=['POST'])
+def sync_to_sheets():
+    """Start a background sync of all unsynced data to Google Sheets."""
+    if SheetsSync is None:
         return jsonify({'error': 'Google Sheets sync not configured'}), 500
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+
+    # Held from here until the sync's outcome is recorded
+    release_lock = _try_acquire_sync_lock()
+    if release_lock is None:
+        return jsonify({'status': 'running'}), 202
+
+    # Status reads only look at sync_state, never the lock. A flag left set
+    # by a worker that died mid-sync is reset by the next sync started here.
+    try:
+        models.record_sync_started()
+    except Exception:
+        release_lock()
+        raise
+
+    _sync_executor.submit(_run_sync, release_lock)
+    return jsonify({'status': 'started'}), 202
+
+@app.route('/api/sync/result', methods=['GET'])
+def get_sync_result():
+    """Get the state of the current or most recent sync."""
+    return jsonify(models.get_sync_result())
 
 # ============================================================================
 # Run Application
 # ============================================================================
 
-initialize_app()
+# Deployments that run `flask --app app init-db` once can skip this per worker
+if os.environ.get('SKIP_DB_INIT') != '1':
+    initialize_app()
 
 if __name__ == '__main__':
     app.run(debug=True, port=5001)
@@ -10,6 +10,8 @@ class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     DATABASE_URL = os.environ.get('DATABASE_URL', '')
     DATABASE_PATH = os.path.join(BASE_DIR, 'data', 'tracker.db')
+    DB_POOL_MIN_CONNECTIONS = int(os.environ.get('DB_POOL_MIN_CONNECTIONS', '2'))
+    DB_POOL_MAX_CONNECTIONS = int(os.environ.get('DB_POOL_MAX_CONNECTIONS', '16'))
     GOOGLE_SHEETS_CREDENTIALS_PATH = os.environ.get('GOOGLE_SHEETS_CREDENTIALS_PATH', 'credentials.json')
     GOOGLE_SHEETS_SPREADSHEET_ID = os.environ.get('GOOGLE_SHEETS_SPREADSHEET_ID', '')
     TIMEZONE = os.environ.get('TIMEZONE', 'US/Central')
@@ -1,37 +1,286 @@
+import hashlib
+import itertools
 import os
+import threading
+from contextlib import contextmanager
 from datetime import date
 from config import Config
 
+# The backend is fixed for the life of the process
+USE_POSTGRES = Config.use_postgres()
 
-def get_db():
-    """Get database connection."""
-    if Config.use_postgres():
-        import psycopg2
-        import psycopg2.extras
-        db = psycopg2.connect(Config.DATABASE_URL)
-        db.autocommit = False
+if USE_POSTGRES:
+    import psycopg2.extensions
+    import psycopg2.extras
+    import psycopg2.pool
+
+    class PreparingConnection(psycopg2.extensions.connection):
+        """psycopg2 connection that tracks its server-side prepared statements."""
+
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.prepared = set()
+else:
+    import sqlite3
+
+# Bump whenever the schema, the ALTERs or _INDEX_MIGRATIONS change, so that
+# databases already recorded at an older version are migrated at next boot
+SCHEMA_VERSION = 7
+
+# Whether a Sheets sync is running and the outcome of the most recent one, kept
+# in one row (id = 1) so that every worker process reports the same state
+_SYNC_STATE_TABLE = '''
+    CREATE TABLE IF NOT EXISTS sync_state (
+        id INTEGER PRIMARY KEY,
+        running BOOLEAN NOT NULL DEFAULT FALSE,
+        last_result TEXT,
+        last_error TEXT,
+        last_ts TEXT
+    )
+'''
+
+# Sort rank of each open deal stage, most advanced first, stored in
+# deals.stage_rank. Closed deals have no rank.
+DEAL_STAGE_RANKS = {'negotiation': 1, 'proposal': 2, 'design': 3, 'discovery': 4}
+
+_DEAL_STAGE_RANK_SQL = 'CASE stage ' + ' '.join(
+    f"WHEN '{stage}' THEN {rank}" for stage, rank in DEAL_STAGE_RANKS.items()
+) + ' END'
+
+# Sort rank of each contact role, stored in contacts.role_rank. Contacts with
+# any other role (or none) rank after these.
+CONTACT_ROLE_RANKS = {'champion': 1, 'decision_maker': 2, 'technical_eval': 3, 'influencer': 4, 'blocker': 5}
+CONTACT_OTHER_ROLE_RANK = 6
+
+_CONTACT_ROLE_RANK_SQL = 'CASE role ' + ' '.join(
+    f"WHEN '{role}' THEN {rank}" for role, rank in CONTACT_ROLE_RANKS.items()
+) + f' ELSE {CONTACT_OTHER_ROLE_RANK} END'
+
+# Denormalized per-account stats kept on accounts, as (column, type) pairs
+_ACCOUNT_COUNTER_COLUMNS = [
+    ('last_activity_date', 'DATE'),
+    ('last_activity_description', 'TEXT'),
+    ('open_task_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('active_deal_count', 'INTEGER NOT NULL DEFAULT 0'),
+    ('pipeline_value', 'DECIMAL(12,2) NOT NULL DEFAULT 0'),
+    ('top_deal_stage', 'TEXT'),
+    ('contact_count', 'INTEGER NOT NULL DEFAULT 0'),
+]
+
+# SET clauses recomputing those stats from each child table, for an UPDATE
+# of accounts. Writers refresh the ones their table feeds.
+ACCOUNT_COUNTER_UPDATES = {
+    'activities': '''
+        last_activity_date = (
+            SELECT MAX(activity_date) FROM activities WHERE account_id = accounts.id
+        ),
+        last_activity_description = (
+            SELECT description FROM activities WHERE account_id = accounts.id
+            ORDER BY activity_date DESC, created_at DESC, id DESC LIMIT 1
+        )''',
+    'tasks': '''
+        open_task_count = (
+            SELECT COUNT(*) FROM tasks WHERE account_id = accounts.id AND status = 'open'
+        )''',
+    'deals': '''
+        active_deal_count = (
+            SELECT COUNT(*) FROM deals
+            WHERE account_id = accounts.id AND stage NOT IN ('closed_won', 'closed_lost')
+        ),
+        pipeline_value = (
+            SELECT COALESCE(SUM(value), 0) FROM deals
+            WHERE account_id = accounts.id AND stage NOT IN ('closed_won', 'closed_lost')
+        ),
+        top_deal_stage = (
+            SELECT stage FROM deals
+            WHERE account_id = accounts.id AND stage_rank IS NOT NULL
+            ORDER BY stage_rank LIMIT 1
+        )''',
+    'contacts': '''
+        contact_count = (
+            SELECT COUNT(*) FROM contacts WHERE account_id = accounts.id
+        )''',
+}
+
+# Index changes applied to existing databases by run_migrations()
+_INDEX_MIGRATIONS = [
+    'CREATE INDEX IF NOT EXISTS idx_activities_latest ON activities(account_id, activity_date DESC, created_at DESC, id DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_acct_status ON tasks(account_id, status)',
+    'CREATE INDEX IF NOT EXISTS idx_touches_date_acct ON daily_touches(touch_date, account_id)',
+    'CREATE INDEX IF NOT EXISTS idx_activities_unsynced_date ON activities(activity_date DESC) WHERE synced_to_sheets = FALSE',
+    'CREATE INDEX IF NOT EXISTS idx_tasks_unsynced_created ON tasks(created_at DESC) WHERE synced_to_sheets = FALSE',
+    'CREATE INDEX IF NOT EXISTS idx_notes_unsynced_date ON notes(note_date DESC) WHERE synced_to_sheets = FALSE',
+    'CREATE INDEX IF NOT EXISTS idx_deals_unsynced_created ON deals(created_at DESC) WHERE synced_to_sheets = FALSE',
+    "CREATE INDEX IF NOT EXISTS idx_tasks_open_due ON tasks(due_date) WHERE status = 'open'",
+    'CREATE INDEX IF NOT EXISTS idx_deals_acct_rank_created ON deals(account_id, stage_rank, created_at DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_contacts_acct_rank_name ON contacts(account_id, role_rank, name)',
+    'DROP INDEX IF EXISTS idx_activities_account_id',
+    'DROP INDEX IF EXISTS idx_activities_acct_date',
+    'DROP INDEX IF EXISTS idx_tasks_account_id',
+    'DROP INDEX IF EXISTS idx_daily_touches_date',
+    'DROP INDEX IF EXISTS idx_tasks_status',
+    'DROP INDEX IF EXISTS idx_activities_unsynced',
+    'DROP INDEX IF EXISTS idx_tasks_unsynced',
+    'DROP INDEX IF EXISTS idx_notes_unsynced',
+    'DROP INDEX IF EXISTS idx_deals_unsynced',
+    'DROP INDEX IF EXISTS idx_deals_acct_rank',
+    'DROP INDEX IF EXISTS idx_deals_account_id',
+    'DROP INDEX IF EXISTS idx_contacts_account_id',
+]
+
+# Placeholder-translated SQL, keyed by the original query text
+_QUERY_CACHE = {}
+
+# (name, PREPARE sql, EXECUTE sql) for Postgres prepared statements, keyed by query text
+_PREPARED_CACHE = {}
+
+# Suffixes for server-side cursor names, unique within the process
+_cursor_ids = itertools.count()
+
+
+# Postgres connections are pooled per process; SQLite keeps one cached
+# connection per thread so its page cache survives between queries.
+_pg_pool = None
+_pg_pool_pid = None
+_pg_pool_lock = threading.Lock()
+_sqlite_local = threading.local()
+
+
+def _get_pg_pool():
+    """Get the Postgres connection pool, creating it on first use in this process."""
+    global _pg_pool, _pg_pool_pid
+    if _pg_pool is None or _pg_pool_pid != os.getpid():
+        with _pg_pool_lock:
+            if _pg_pool is None or _pg_pool_pid != os.getpid():
+                _pg_pool = psycopg2.pool.ThreadedConnectionPool(
+                    minconn=Config.DB_POOL_MIN_CONNECTIONS,
+                    maxconn=Config.DB_POOL_MAX_CONNECTIONS,
+                    dsn=Config.DATABASE_URL,
+                    connection_factory=PreparingConnection
+                )
+                _pg_pool_pid = os.getpid()
+    return _pg_pool
+
+
+def _connect_sqlite():
+    """Open and configure a new SQLite connection."""
+    # Keep hot queries compiled: the default statement cache holds only 128.
+    # Write transactions start with BEGIN IMMEDIATE, taking the write lock up
+    # front instead of upgrading mid-transaction; waits are bounded by timeout.
+    db = sqlite3.connect(
+        Config.DATABASE_PATH, cached_statements=512,
+        isolation_level='IMMEDIATE', timeout=5.0
+    )
+    db.row_factory = sqlite3.Row
+    # Connection-scoped tuning; journal_mode=WAL is persisted by init_db
+    db.execute('PRAGMA synchronous=NORMAL')
+    db.execute('PRAGMA mmap_size=268435456')
+    db.execute('PRAGMA cache_size=-64000')
+    db.execute('PRAGMA temp_store=MEMORY')
+    return db
+
+
+def get_db(autocommit=False):
+    """Get database connection.
+
+    Connections are reused: Postgres connections are checked out of the
+    pool keyed by the current thread, SQLite connections are cached per
+    thread. Any transaction left open by a failed caller is rolled back.
+
+    autocommit=True is for callers that issue a single write statement: on
+    Postgres it skips the BEGIN and COMMIT round trips around it, and
+    db.commit() becomes a no-op. SQLite is in-process and ignores it.
+    """
+    if USE_POSTGRES:
+        db = _get_pg_pool().getconn(key=threading.get_ident())
+        if db.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+            db.rollback()
+        db.autocommit = autocommit
         return db
     else:
-        import sqlite3
-        db = sqlite3.connect(Config.DATABASE_PATH)
-        db.row_factory = sqlite3.Row
+        db = getattr(_sqlite_local, 'db', None)
+        if db is None:
+            db = _connect_sqlite()
+            _sqlite_local.db = db
+        elif db.in_transaction:
+            db.rollback()
         return db
 
 
 def close_db(db):
-    """Close database connection."""
+    """Release database connection back to the pool."""
+    if db is None:
+        return
+    if USE_POSTGRES:
+        _get_pg_pool().putconn(db, key=threading.get_ident())
+    elif db.in_transaction:
+        db.rollback()
+
+
+@contextmanager
+def db_connection(autocommit=False):
+    """Check out a connection for a with block, releasing it even on error."""
+    db = get_db(autocommit)
+    try:
+        yield db
+    finally:
+        close_db(db)
+
+
+def _discard_sqlite_connection():
+    """Close this thread's cached SQLite connection."""
+    db = getattr(_sqlite_local, 'db', None)
     if db is not None:
         db.close()
+        _sqlite_local.db = None
+
+
+def _prepared_statement(query):
+    """Get the (name, PREPARE sql, EXECUTE sql) triple for a ?-style query."""
+    statement = _PREPARED_CACHE.get(query)
+    if statement is None:
+        parts = query.split('?')
+        body = parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+        name = 'stmt_' + hashlib.md5(query.encode('utf-8')).hexdigest()[:16]
+        execute_sql = f'EXECUTE {name}'
+        if len(parts) > 1:
+            execute_sql += ' (' + ', '.join(['%s'] * (len(parts) - 1)) + ')'
+        statement = _PREPARED_CACHE[query] = (name, f'PREPARE {name} AS {body}', execute_sql)
+    return statement
+
+
+def _deallocate_prepared(db):
+    """Drop this Postgres connection's prepared statements after schema changes."""
+    if db.prepared:
+        cursor = db.cursor()
+        cursor.execute('DEALLOCATE ALL')
+        cursor.close()
+        db.prepared.clear()
 
 
-def execute_query(db, query, params=None):
-    """Execute a query, handling SQLite vs PostgreSQL placeholder differences."""
-    if Config.use_postgres():
-        # Convert ? placeholders to %s for psycopg2
-        query = query.replace('?', '%s')
-        # Convert BOOLEAN DEFAULT FALSE to PostgreSQL-compatible syntax
-        import psycopg2.extras
-        cursor = db.cursor(cursor_factory=psycopg2.extras.RealDictCursor)
+def _translate_placeholders(query):
+    """Convert ? placeholders to %s for psycopg2."""
+    translated = _QUERY_CACHE.get(query)
+    if translated is None:
+        translated = _QUERY_CACHE[query] = query.replace('?', '%s')
+    return translated
+
+
+def execute_query(db, query, params=None, prepare=False):
+    """Execute a query, handling SQLite vs PostgreSQL placeholder differences.
+
+    With prepare=True on Postgres the query is PREPAREd once per connection
+    and run with EXECUTE afterwards, skipping the planner on repeat calls.
+    """
+    if USE_POSTGRES:
+        cursor = db.cursor()
+        if prepare:
+            name, prepare_sql, query = _prepared_statement(query)
+            if name not in db.prepared:
+                cursor.execute(prepare_sql)
+                db.prepared.add(name)
+        else:
+            query = _translate_placeholders(query)
     else:
         cursor = db.cursor()
 
@@ -42,43 +291,118 @@ def execute_query(db, query, params=None):
     return cursor
 
 
-def fetchall(db, query, params=None):
-    """Execute query and return all rows as dicts."""
-    cursor = execute_query(db, query, params)
+def rows_as_dicts(cursor, rows):
+    """Give fetched rows row['column'] access.
+
+    Postgres cursors return plain tuples, which are zipped with the column
+    names into dicts. SQLite rows are sqlite3.Row and are returned as is.
+    """
+    if USE_POSTGRES:
+        columns = [column[0] for column in cursor.description]
+        return [dict(zip(columns, row)) for row in rows]
+    return rows
+
+
+def fetchall(db, query, params=None, prepare=False, as_dict=True):
+    """Execute query and return all rows.
+
+    With as_dict=True rows support row['column'] access (dicts on
+    Postgres, sqlite3.Row on SQLite); callers that need to modify rows
+    should copy them with dict(row). With as_dict=False the driver's rows
+    are returned untouched for positional access.
+    """
+    cursor = execute_query(db, query, params, prepare)
     rows = cursor.fetchall()
+    if as_dict:
+        rows = rows_as_dicts(cursor, rows)
     cursor.close()
-    if Config.use_postgres():
-        return [dict(row) for row in rows]
+    return rows
+
+
+def iter_rows(db, query, params=None, chunk=500):
+    """Execute query and yield its rows in lists of up to chunk rows.
+
+    On Postgres the rows are read through a server-side cursor, so only one
+    chunk is held in memory at a time however large the result is.
+    """
+    if USE_POSTGRES:
+        cursor = db.cursor(name=f'iter_rows_{next(_cursor_ids)}')
+        cursor.execute(_translate_placeholders(query), params)
     else:
-        return [dict(row) for row in rows]
+        cursor = execute_query(db, query, params)
+
+    try:
+        rows = cursor.fetchmany(chunk)
+        while rows:
+            yield rows_as_dicts(cursor, rows)
+            rows = cursor.fetchmany(chunk)
+    finally:
+        cursor.close()
 
 
-def fetchone(db, query, params=None):
+def fetchone(db, query, params=None, prepare=False):
     """Execute query and return one row as dict."""
-    cursor = execute_query(db, query, params)
+    cursor = execute_query(db, query, params, prepare)
+    row = cursor.fetchone()
+    if row is not None:
+        if USE_POSTGRES:
+            row = dict(zip([column[0] for column in cursor.description], row))
+        else:
+            row = dict(row)
+    cursor.close()
+    return row
+
+
+def fetchval(db, query, params=None, prepare=False):
+    """Execute query and return the first column of the first row."""
+    cursor = execute_query(db, query, params, prepare)
     row = cursor.fetchone()
     cursor.close()
     if row is None:
         return None
-    return dict(row)
+    return row[0]
 
 
-def execute(db, query, params=None):
+def execute(db, query, params=None, prepare=False):
     """Execute a write query and return the cursor."""
-    return execute_query(db, query, params)
+    return execute_query(db, query, params, prepare)
 
 
-def get_last_insert_id(db, cursor):
-    """Get the last inserted row ID."""
-    if Config.use_postgres():
-        return cursor.fetchone()['id']
+def executemany(db, query, rows):
+    """Execute a write query once per parameter tuple in rows."""
+    if USE_POSTGRES:
+        # execute_batch sends the statements in pages rather than one round trip each
+        cursor = db.cursor()
+        psycopg2.extras.execute_batch(cursor, _translate_placeholders(query), rows, page_size=500)
+        cursor.close()
     else:
-        return cursor.lastrowid
+        db.executemany(query, rows)
+
+
+def execute_values(db, query, rows, page_size=1000):
+    """Run a Postgres query whose VALUES %s is filled from rows, page_size rows per statement."""
+    cursor = db.cursor()
+    psycopg2.extras.execute_values(cursor, query, rows, page_size=page_size)
+    cursor.close()
+
+
+# INSERT ... RETURNING needs SQLite 3.35+; older libraries fall back to lastrowid
+_INSERT_RETURNING = USE_POSTGRES or sqlite3.sqlite_version_info >= (3, 35, 0)
+
+
+def insert_returning_id(db, query, params=None, prepare=False):
+    """Run an INSERT (without a RETURNING clause) and return the new row's id."""
+    if _INSERT_RETURNING:
+        return fetchval(db, query.rstrip() + ' RETURNING id', params, prepare)
+    cursor = execute_query(db, query, params, prepare)
+    row_id = cursor.lastrowid
+    cursor.close()
+    return row_id
 
 
 def init_db():
     """Initialize database with schema."""
-    if Config.use_postgres():
+    if USE_POSTGRES:
         _init_postgres()
     else:
         _init_sqlite()
@@ -86,10 +410,14 @@ def init_db():
 
 def _init_sqlite():
     """Initialize SQLite database."""
-    import sqlite3
     os.makedirs(os.path.dirname(Config.DATABASE_PATH), exist_ok=True)
 
     db = get_db()
+    db.execute('PRAGMA journal_mode=WAL')
+
+    # sqlite3 runs DDL in autocommit mode; one explicit transaction makes the
+    # whole schema a single commit instead of one per statement
+    db.execute('BEGIN')
 
     db.execute('''
         CREATE TABLE IF NOT EXISTS accounts (
@@ -99,7 +427,14 @@ def _init_sqlite():
             location TEXT,
             renewal_date DATE,
             annual_value DECIMAL(12,2),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity_date DATE,
+            last_activity_description TEXT,
+            open_task_count INTEGER NOT NULL DEFAULT 0,
+            active_deal_count INTEGER NOT NULL DEFAULT 0,
+            pipeline_value DECIMAL(12,2) NOT NULL DEFAULT 0,
+            top_deal_stage TEXT,
+            contact_count INTEGER NOT NULL DEFAULT 0
         )
     ''')
 
@@ -159,6 +494,7 @@ def _init_sqlite():
             account_id INTEGER NOT NULL,
             name TEXT NOT NULL,
             stage TEXT NOT NULL DEFAULT 'discovery',
+            stage_rank SMALLINT,
             value DECIMAL(12,2),
             products TEXT,
             expected_close_date DATE,
@@ -178,6 +514,7 @@ def _init_sqlite():
             name TEXT NOT NULL,
             title TEXT,
             role TEXT,
+            role_rank SMALLINT NOT NULL DEFAULT 6,
             email TEXT,
             phone TEXT,
             notes TEXT,
@@ -187,15 +524,24 @@ def _init_sqlite():
         )
     ''')
 
-    db.execute('CREATE INDEX IF NOT EXISTS idx_activities_account_id ON activities(account_id)')
+    db.execute(_SYNC_STATE_TABLE)
+
+    db.execute('CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)')
+
+    db.execute('CREATE INDEX IF NOT EXISTS idx_activities_latest ON activities(account_id, activity_date DESC, created_at DESC, id DESC)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_activities_date ON activities(activity_date)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_tasks_account_id ON tasks(account_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_tasks_acct_status ON tasks(account_id, status)')
+    db.execute("CREATE INDEX IF NOT EXISTS idx_tasks_open_due ON tasks(due_date) WHERE status = 'open'")
     db.execute('CREATE INDEX IF NOT EXISTS idx_notes_account_id ON notes(account_id)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_daily_touches_date ON daily_touches(touch_date)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_deals_account_id ON deals(account_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_touches_date_acct ON daily_touches(touch_date, account_id)')
     db.execute('CREATE INDEX IF NOT EXISTS idx_deals_stage ON deals(stage)')
-    db.execute('CREATE INDEX IF NOT EXISTS idx_contacts_account_id ON contacts(account_id)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_deals_acct_rank_created ON deals(account_id, stage_rank, created_at DESC)')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_contacts_acct_rank_name ON contacts(account_id, role_rank, name)')
+    # Partial indexes in sync order: the sync only ever reads rows not yet synced
+    db.execute('CREATE INDEX IF NOT EXISTS idx_activities_unsynced_date ON activities(activity_date DESC) WHERE synced_to_sheets = FALSE')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_tasks_unsynced_created ON tasks(created_at DESC) WHERE synced_to_sheets = FALSE')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_notes_unsynced_date ON notes(note_date DESC) WHERE synced_to_sheets = FALSE')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_deals_unsynced_created ON deals(created_at DESC) WHERE synced_to_sheets = FALSE')
 
     db.commit()
     close_db(db)
@@ -203,10 +549,9 @@ def _init_sqlite():
 
 def _init_postgres():
     """Initialize PostgreSQL database."""
-    db = get_db()
-    cursor = db.cursor()
+    statements = []
 
-    cursor.execute('''
+    statements.append('''
         CREATE TABLE IF NOT EXISTS accounts (
             id SERIAL PRIMARY KEY,
             name TEXT NOT NULL UNIQUE,
@@ -214,11 +559,18 @@ def _init_postgres():
             location TEXT,
             renewal_date DATE,
             annual_value DECIMAL(12,2),
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_activity_date DATE,
+            last_activity_description TEXT,
+            open_task_count INTEGER NOT NULL DEFAULT 0,
+            active_deal_count INTEGER NOT NULL DEFAULT 0,
+            pipeline_value DECIMAL(12,2) NOT NULL DEFAULT 0,
+            top_deal_stage TEXT,
+            contact_count INTEGER NOT NULL DEFAULT 0
         )
     ''')
 
-    cursor.execute('''
+    statements.append('''
         CREATE TABLE IF NOT EXISTS activities (
             id SERIAL PRIMARY KEY,
             account_id INTEGER NOT NULL REFERENCES accounts(id),
@@ -230,7 +582,7 @@ def _init_postgres():
         )
     ''')
 
-    cursor.execute('''
+    statements.append('''
         CREATE TABLE IF NOT EXISTS tasks (
             id SERIAL PRIMARY KEY,
             account_id INTEGER NOT NULL REFERENCES accounts(id),
@@ -244,7 +596,7 @@ def _init_postgres():
         )
     ''')
 
-    cursor.execute('''
+    statements.append('''
         CREATE TABLE IF NOT EXISTS notes (
             id SERIAL PRIMARY KEY,
             account_id INTEGER NOT NULL REFERENCES accounts(id),
@@ -255,7 +607,7 @@ def _init_postgres():
         )
     ''')
 
-    cursor.execute('''
+    statements.append('''
         CREATE TABLE IF NOT EXISTS daily_touches (
             id SERIAL PRIMARY KEY,
             account_id INTEGER NOT NULL REFERENCES accounts(id),
@@ -264,12 +616,13 @@ def _init_postgres():
         )
     ''')
 
-    cursor.execute('''
+    statements.append('''
         CREATE TABLE IF NOT EXISTS deals (
             id SERIAL PRIMARY KEY,
             account_id INTEGER NOT NULL REFERENCES accounts(id),
             name TEXT NOT NULL,
             stage TEXT NOT NULL DEFAULT 'discovery',
+            stage_rank SMALLINT,
             value DECIMAL(12,2),
             products TEXT,
             expected_close_date DATE,
@@ -281,13 +634,14 @@ def _init_postgres():
         )
     ''')
 
-    cursor.execute('''
+    statements.append('''
         CREATE TABLE IF NOT EXISTS contacts (
             id SERIAL PRIMARY KEY,
             account_id INTEGER NOT NULL REFERENCES accounts(id),
             name TEXT NOT NULL,
             title TEXT,
             role TEXT,
+            role_rank SMALLINT NOT NULL DEFAULT 6,
             email TEXT,
             phone TEXT,
             notes TEXT,
@@ -296,35 +650,65 @@ def _init_postgres():
         )
     ''')
 
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_activities_account_id ON activities(account_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_activities_date ON activities(activity_date)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_account_id ON tasks(account_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notes_account_id ON notes(account_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_daily_touches_date ON daily_touches(touch_date)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_account_id ON deals(account_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_stage ON deals(stage)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_contacts_account_id ON contacts(account_id)')
-
+    statements.append(_SYNC_STATE_TABLE)
+
+    statements.append('CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)')
+
+    statements.append('CREATE INDEX IF NOT EXISTS idx_activities_latest ON activities(account_id, activity_date DESC, created_at DESC, id DESC)')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_activities_date ON activities(activity_date)')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_tasks_acct_status ON tasks(account_id, status)')
+    statements.append("CREATE INDEX IF NOT EXISTS idx_tasks_open_due ON tasks(due_date) WHERE status = 'open'")
+    statements.append('CREATE INDEX IF NOT EXISTS idx_notes_account_id ON notes(account_id)')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_touches_date_acct ON daily_touches(touch_date, account_id)')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_deals_stage ON deals(stage)')
+    # Tables created by older versions lack the rank columns; add them before indexing
+    statements.append('ALTER TABLE deals ADD COLUMN IF NOT EXISTS stage_rank SMALLINT')
+    statements.append('ALTER TABLE contacts ADD COLUMN IF NOT EXISTS role_rank SMALLINT NOT NULL DEFAULT 6')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_deals_acct_rank_created ON deals(account_id, stage_rank, created_at DESC)')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_contacts_acct_rank_name ON contacts(account_id, role_rank, name)')
+    # Partial indexes in sync order: the sync only ever reads rows not yet synced
+    statements.append('CREATE INDEX IF NOT EXISTS idx_activities_unsynced_date ON activities(activity_date DESC) WHERE synced_to_sheets = FALSE')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_tasks_unsynced_created ON tasks(created_at DESC) WHERE synced_to_sheets = FALSE')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_notes_unsynced_date ON notes(note_date DESC) WHERE synced_to_sheets = FALSE')
+    statements.append('CREATE INDEX IF NOT EXISTS idx_deals_unsynced_created ON deals(created_at DESC) WHERE synced_to_sheets = FALSE')
+
+    # One multi-statement execute sends the whole schema in a single round trip
+    db = get_db()
+    cursor = db.cursor()
+    cursor.execute(';\n'.join(statements))
     cursor.close()
+    _deallocate_prepared(db)
     db.commit()
     close_db(db)
 
 
 def run_migrations():
-    """Run migrations to add new columns to existing tables (idempotent)."""
+    """Run migrations to add new columns and indexes to existing tables (idempotent)."""
     db = get_db()
 
     # Add renewal_date and annual_value to accounts if they don't exist
-    if Config.use_postgres():
+    if USE_POSTGRES:
         cursor = db.cursor()
         try:
             cursor.execute('ALTER TABLE accounts ADD COLUMN IF NOT EXISTS renewal_date DATE')
             cursor.execute('ALTER TABLE accounts ADD COLUMN IF NOT EXISTS annual_value DECIMAL(12,2)')
         except Exception:
             pass
+        cursor.execute(';\n'.join(
+            f'ALTER TABLE accounts ADD COLUMN IF NOT EXISTS {column} {column_type}'
+            for column, column_type in _ACCOUNT_COUNTER_COLUMNS
+        ))
+        cursor.execute('ALTER TABLE deals ADD COLUMN IF NOT EXISTS stage_rank SMALLINT')
+        cursor.execute('ALTER TABLE contacts ADD COLUMN IF NOT EXISTS role_rank SMALLINT NOT NULL DEFAULT 6')
+        cursor.execute(_SYNC_STATE_TABLE)
+        cursor.execute('ALTER TABLE sync_state ADD COLUMN IF NOT EXISTS running BOOLEAN NOT NULL DEFAULT FALSE')
+        cursor.execute(';\n'.join(_INDEX_MIGRATIONS))
         cursor.close()
+        _deallocate_prepared(db)
     else:
+        # Databases created before WAL was enabled still use the rollback journal
+        db.execute('PRAGMA journal_mode=WAL')
+
         # SQLite doesn't have IF NOT EXISTS for ALTER TABLE
         try:
             db.execute('ALTER TABLE accounts ADD COLUMN renewal_date DATE')
@@ -334,11 +718,58 @@ def run_migrations():
             db.execute('ALTER TABLE accounts ADD COLUMN annual_value DECIMAL(12,2)')
         except Exception:
             pass
+        columns = {row['name'] for row in db.execute('PRAGMA table_info(accounts)')}
+        for column, column_type in _ACCOUNT_COUNTER_COLUMNS:
+            if column not in columns:
+                db.execute(f'ALTER TABLE accounts ADD COLUMN {column} {column_type}')
+        if 'stage_rank' not in {row['name'] for row in db.execute('PRAGMA table_info(deals)')}:
+            db.execute('ALTER TABLE deals ADD COLUMN stage_rank SMALLINT')
+        if 'role_rank' not in {row['name'] for row in db.execute('PRAGMA table_info(contacts)')}:
+            db.execute('ALTER TABLE contacts ADD COLUMN role_rank SMALLINT NOT NULL DEFAULT 6')
+        db.execute(_SYNC_STATE_TABLE)
+        if 'running' not in {row['name'] for row in db.execute('PRAGMA table_info(sync_state)')}:
+            db.execute('ALTER TABLE sync_state ADD COLUMN running BOOLEAN NOT NULL DEFAULT FALSE')
+        for statement in _INDEX_MIGRATIONS:
+            db.execute(statement)
+
+    execute(db, f'UPDATE deals SET stage_rank = {_DEAL_STAGE_RANK_SQL}')
+    execute(db, f'UPDATE contacts SET role_rank = {_CONTACT_ROLE_RANK_SQL}')
+
+    # Backfill the denormalized account stats from the child tables
+    execute(db, 'UPDATE accounts SET ' + ','.join(ACCOUNT_COUNTER_UPDATES.values()))
 
     db.commit()
     close_db(db)
 
 
+def get_schema_version():
+    """Get the schema version recorded in schema_migrations, or None if unset."""
+    db = get_db()
+    cursor = db.cursor()
+    if USE_POSTGRES:
+        # One round trip: the result is that of the final statement
+        cursor.execute(
+            'CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY);'
+            'SELECT MAX(version) FROM schema_migrations'
+        )
+    else:
+        cursor.execute('CREATE TABLE IF NOT EXISTS schema_migrations (version INTEGER PRIMARY KEY)')
+        cursor.execute('SELECT MAX(version) FROM schema_migrations')
+    version = cursor.fetchone()[0]
+    cursor.close()
+    db.commit()
+    close_db(db)
+    return version
+
+
+def record_schema_version():
+    """Record that the database schema is at SCHEMA_VERSION."""
+    db = get_db()
+    execute(db, 'INSERT INTO schema_migrations (version) VALUES (?) ON CONFLICT DO NOTHING', (SCHEMA_VERSION,))
+    db.commit()
+    close_db(db)
+
+
 def seed_accounts():
     """Seed the database with initial account data."""
     accounts = [
@@ -360,25 +791,20 @@ def seed_accounts():
 
     db = get_db()
 
-    for name, industry, location in accounts:
-        try:
-            if Config.use_postgres():
-                cursor = db.cursor()
-                cursor.execute(
-                    'INSERT INTO accounts (name, industry, location) VALUES (%s, %s, %s) ON CONFLICT (name) DO NOTHING',
-                    (name, industry, location)
-                )
-                cursor.close()
-            else:
-                try:
-                    db.execute(
-                        'INSERT INTO accounts (name, industry, location) VALUES (?, ?, ?)',
-                        (name, industry, location)
-                    )
-                except Exception:
-                    pass
-        except Exception:
-            pass
+    if USE_POSTGRES:
+        cursor = db.cursor()
+        psycopg2.extras.execute_values(
+            cursor,
+            'INSERT INTO accounts (name, industry, location) VALUES %s ON CONFLICT (name) DO NOTHING',
+            accounts,
+            page_size=len(accounts)
+        )
+        cursor.close()
+    else:
+        db.executemany(
+            'INSERT OR IGNORE INTO accounts (name, industry, location) VALUES (?, ?, ?)',
+            accounts
+        )
 
     db.commit()
     close_db(db)
@@ -386,20 +812,19 @@ def seed_accounts():
 
 def reset_database():
     """Reset the database (delete and recreate)."""
-    if Config.use_postgres():
+    if USE_POSTGRES:
         db = get_db()
         cursor = db.cursor()
-        cursor.execute('DROP TABLE IF EXISTS contacts')
-        cursor.execute('DROP TABLE IF EXISTS deals')
-        cursor.execute('DROP TABLE IF EXISTS daily_touches')
-        cursor.execute('DROP TABLE IF EXISTS notes')
-        cursor.execute('DROP TABLE IF EXISTS tasks')
-        cursor.execute('DROP TABLE IF EXISTS activities')
-        cursor.execute('DROP TABLE IF EXISTS accounts')
+        # schema_migrations goes too, so the next startup migrates and records the version again
+        cursor.execute(
+            'DROP TABLE IF EXISTS schema_migrations, sync_state, contacts, deals, daily_touches, '
+            'notes, tasks, activities, accounts'
+        )
         cursor.close()
         db.commit()
         close_db(db)
     else:
+        _discard_sqlite_connection()
         if os.path.exists(Config.DATABASE_PATH):
             os.remove(Config.DATABASE_PATH)
     init_db()
@@ -0,0 +1,26 @@
+"""Gunicorn configuration for Account Daily Tracker."""
+
+import multiprocessing
+import os
+
+from config import Config
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+workers = multiprocessing.cpu_count() * 2 + 1
+
+if Config.use_postgres():
+    # Requests mostly wait on Postgres and Google Sheets, so use cooperative
+    # gevent workers (gunicorn monkey-patches the worker on startup). Keep
+    # concurrent requests per worker within the database connection pool,
+    # leaving one connection for the background Sheets sync.
+    worker_class = 'gevent'
+    worker_connections = max(Config.DB_POOL_MAX_CONNECTIONS - 1, 1)
+
+    def post_fork(server, worker):
+        """Make psycopg2 yield to the gevent loop while waiting on the server."""
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
+else:
+    # sqlite3 calls block the event loop, so SQLite deployments use threads
+    worker_class = 'gthread'
+    threads = 4
@@ -1,110 +1,231 @@
 from datetime import date, datetime, timedelta
-from database import get_db, close_db, fetchall, fetchone, execute, get_last_insert_id
+import threading
+import orjson
+from cachetools import TTLCache
+from database import (
+    USE_POSTGRES, ACCOUNT_COUNTER_UPDATES, DEAL_STAGE_RANKS, CONTACT_ROLE_RANKS,
+    CONTACT_OTHER_ROLE_RANK, db_connection, fetchall, fetchone,
+    fetchval, execute, executemany, execute_values, execute_query, insert_returning_id,
+    iter_rows, rows_as_dicts
+)
 from config import Config
 
+# Bumped after every committed write, so callers can tell cached reads apart
+# from ones built before the latest change
+_data_generation = 0
+
+def data_generation():
+    """Get the current data generation for keying cached reads."""
+    return _data_generation
+
+def _bump_data_generation():
+    """Mark all previously cached reads as stale."""
+    global _data_generation
+    _data_generation += 1
+
+# Account detail lists (notes, deals, contacts) keyed by (kind, account id,
+# data generation): any write made in this process invalidates them, and the
+# TTL bounds staleness from writes in other worker processes
+_account_detail_cache = TTLCache(maxsize=1024, ttl=10)
+_account_detail_cache_lock = threading.Lock()
+
+def _cached_account_detail(kind, account_id, fetch):
+    """Return a cached account detail list, fetching it on a miss."""
+    key = (kind, account_id, _data_generation)
+    with _account_detail_cache_lock:
+        rows = _account_detail_cache.get(key)
+
+    if rows is None:
+        rows = fetch(account_id)
+        with _account_detail_cache_lock:
+            _account_detail_cache[key] = rows
+
+    return rows
+
 # ============================================================================
 # Account Functions
 # ============================================================================
 
-def get_all_accounts():
+# Account list: task, deal, contact and latest-activity stats are read from
+# the denormalized columns on accounts; only today's activity count is
+# aggregated per request
+_ACCOUNTS_QUERY = '''
+    SELECT
+        a.id,
+        a.name,
+        a.industry,
+        a.location,
+        a.renewal_date,
+        a.annual_value,
+        a.created_at,
+        CASE WHEN dt.id IS NOT NULL THEN 1 ELSE 0 END as touched_today,
+        COALESCE(act.today_count, 0) as today_activity_count,
+        a.open_task_count as open_tasks,
+        a.last_activity_date,
+        a.last_activity_description,
+        a.active_deal_count as active_deals,
+        a.pipeline_value,
+        a.top_deal_stage,
+        a.contact_count
+    FROM accounts a
+    LEFT JOIN daily_touches dt ON a.id = dt.account_id AND dt.touch_date = ?
+    LEFT JOIN (
+        SELECT account_id, COUNT(*) as today_count
+        FROM activities
+        WHERE activity_date = ?
+        GROUP BY account_id
+    ) act ON act.account_id = a.id
+    ORDER BY a.name
+'''
+
+_ACCOUNTS_JSON_QUERY = f'''
+    SELECT COALESCE(json_agg(account ORDER BY account.name), '[]')::text
+    FROM ({_ACCOUNTS_QUERY}) account
+'''
+
+def _fetch_all_accounts(db, today):
+    """Run the account list query on an open connection."""
+    return fetchall(db, _ACCOUNTS_QUERY, (today, today), prepare=True)
+
+def _fetch_all_accounts_json(db, today):
+    """Run the account list query, building the JSON array in Postgres.
+
+    Returns the serialized list as text, so rows never become Python dicts.
+    """
+    return fetchval(db, _ACCOUNTS_JSON_QUERY, (today, today), prepare=True)
+
+def get_all_accounts(today=None):
     """Get all accounts with today's touch status and stats."""
-    db = get_db()
-    today = Config.today().isoformat()
+    if today is None:
+        today = Config.today().isoformat()
 
-    query = '''
-        SELECT
-            a.id,
-            a.name,
-            a.industry,
-            a.location,
-            a.renewal_date,
-            a.annual_value,
-            a.created_at,
-            CASE WHEN dt.id IS NOT NULL THEN 1 ELSE 0 END as touched_today,
-            (SELECT COUNT(*) FROM activities WHERE account_id = a.id AND activity_date = ?) as today_activity_count,
-            (SELECT COUNT(*) FROM tasks WHERE account_id = a.id AND status = 'open') as open_tasks,
-            (SELECT MAX(activity_date) FROM activities WHERE account_id = a.id) as last_activity_date,
-            (SELECT description FROM activities WHERE account_id = a.id ORDER BY activity_date DESC, created_at DESC LIMIT 1) as last_activity_description,
-            (SELECT COUNT(*) FROM deals WHERE account_id = a.id AND stage NOT IN ('closed_won', 'closed_lost')) as active_deals,
-            (SELECT COALESCE(SUM(value), 0) FROM deals WHERE account_id = a.id AND stage NOT IN ('closed_won', 'closed_lost')) as pipeline_value,
-            (SELECT stage FROM deals WHERE account_id = a.id AND stage NOT IN ('closed_won', 'closed_lost') ORDER BY
-                CASE stage
-                    WHEN 'negotiation' THEN 1
-                    WHEN 'proposal' THEN 2
-                    WHEN 'design' THEN 3
-                    WHEN 'discovery' THEN 4
-                END
-            LIMIT 1) as top_deal_stage,
-            (SELECT COUNT(*) FROM contacts WHERE account_id = a.id) as contact_count
-        FROM accounts a
-        LEFT JOIN daily_touches dt ON a.id = dt.account_id AND dt.touch_date = ?
-        ORDER BY a.name
-    '''
+    with db_connection() as db:
+        accounts = _fetch_all_accounts(db, today)
 
-    accounts = fetchall(db, query, (today, today))
-    close_db(db)
     return accounts
 
-def get_account(account_id):
-    """Get single account with full details."""
-    db = get_db()
-    today = Config.today().isoformat()
-
-    query = '''
-        SELECT
-            a.id,
-            a.name,
-            a.industry,
-            a.location,
-            a.renewal_date,
-            a.annual_value,
-            a.created_at,
-            CASE WHEN dt.id IS NOT NULL THEN 1 ELSE 0 END as touched_today,
-            (SELECT COUNT(*) FROM activities WHERE account_id = a.id) as total_activities,
-            (SELECT COUNT(*) FROM tasks WHERE account_id = a.id AND status = 'open') as open_tasks,
-            (SELECT COUNT(*) FROM notes WHERE account_id = a.id) as total_notes,
-            (SELECT COUNT(*) FROM deals WHERE account_id = a.id AND stage NOT IN ('closed_won', 'closed_lost')) as active_deals,
-            (SELECT COUNT(*) FROM contacts WHERE account_id = a.id) as contact_count
+def _fetch_accounts_with_summary(db, today, as_json=False):
+    """Run the account list and today's touched/total counts on an open connection."""
+    if as_json and USE_POSTGRES:
+        accounts = _fetch_all_accounts_json(db, today)
+    else:
+        accounts = _fetch_all_accounts(db, today)
+    summary = fetchone(db, '''
+        SELECT COUNT(*) as total, COUNT(dt.id) as touched
         FROM accounts a
         LEFT JOIN daily_touches dt ON a.id = dt.account_id AND dt.touch_date = ?
-        WHERE a.id = ?
-    '''
+    ''', (today,), prepare=True)
+    return accounts, summary['touched'], summary['total']
+
+def get_accounts_with_summary(today=None, as_json=False):
+    """Get all accounts plus today's touched/total counts.
+
+    Args:
+        today: ISO date to report touches for; defaults to today in Central Time.
+        as_json: On Postgres, return the accounts already serialized as JSON
+            text; SQLite always returns a list of rows.
+
+    Returns:
+        Tuple of (accounts, touched_count, total_count).
+    """
+    if today is None:
+        today = Config.today().isoformat()
+
+    with db_connection() as db:
+        result = _fetch_accounts_with_summary(db, today, as_json)
+
+    return result
+
+def get_account(account_id, today=None):
+    """Get single account with full details."""
+    if today is None:
+        today = Config.today().isoformat()
+
+    with db_connection() as db:
+        query = '''
+            SELECT
+                a.id,
+                a.name,
+                a.industry,
+                a.location,
+                a.renewal_date,
+                a.annual_value,
+                a.created_at,
+                CASE WHEN dt.id IS NOT NULL THEN 1 ELSE 0 END as touched_today,
+                (SELECT COUNT(*) FROM activities WHERE account_id = a.id) as total_activities,
+                a.open_task_count as open_tasks,
+                (SELECT COUNT(*) FROM notes WHERE account_id = a.id) as total_notes,
+                a.active_deal_count as active_deals,
+                a.contact_count
+            FROM accounts a
+            LEFT JOIN daily_touches dt ON a.id = dt.account_id AND dt.touch_date = ?
+            WHERE a.id = ?
+        '''
+
+        account = fetchone(db, query, (today, account_id))
 
-    account = fetchone(db, query, (today, account_id))
-    close_db(db)
     return account
 
+# Columns update_account() may change
+_ACCOUNT_UPDATE_FIELDS = ('name', 'industry', 'location', 'renewal_date', 'annual_value')
+
 def update_account(account_id, **kwargs):
-    """Update account metadata. Only updates fields present in kwargs."""
-    db = get_db()
-
-    account = fetchone(db, 'SELECT * FROM accounts WHERE id = ?', (account_id,))
-    if not account:
-        close_db(db)
-        return None
-
-    # Use new value if provided in kwargs, otherwise keep existing
-    _sentinel = object()
-    name = kwargs.get('name', _sentinel)
-    name = name if name is not _sentinel else account['name']
-    industry = kwargs.get('industry', _sentinel)
-    industry = industry if industry is not _sentinel else account['industry']
-    location = kwargs.get('location', _sentinel)
-    location = location if location is not _sentinel else account['location']
-    renewal_date = kwargs.get('renewal_date', _sentinel)
-    renewal_date = renewal_date if renewal_date is not _sentinel else account['renewal_date']
-    annual_value = kwargs.get('annual_value', _sentinel)
-    annual_value = annual_value if annual_value is not _sentinel else account['annual_value']
-
-    execute(db, '''
-        UPDATE accounts
-        SET name = ?, industry = ?, location = ?, renewal_date = ?, annual_value = ?
-        WHERE id = ?
-    ''', (name, industry, location, renewal_date, annual_value, account_id))
-
-    db.commit()
-    close_db(db)
-    return account_id
+    """Update account metadata. Only updates fields present in kwargs.
+
+    A field passed as None is cleared; fields not passed are left as is.
+    """
+    fields = [field for field in _ACCOUNT_UPDATE_FIELDS if field in kwargs]
+
+    with db_connection(autocommit=True) as db:
+        if fields:
+            assignments = ', '.join(f'{field} = ?' for field in fields)
+            cursor = execute(db, f'UPDATE accounts SET {assignments} WHERE id = ?',
+                             [kwargs[field] for field in fields] + [account_id])
+            updated = cursor.rowcount
+        else:
+            updated = fetchval(db, 'SELECT 1 FROM accounts WHERE id = ?', (account_id,))
+
+        db.commit()
+        _bump_data_generation()
+
+    return account_id if updated else None
+
+# Counter refreshes per child table, by account id and by child row id, each
+# preceded on Postgres by a lock on the account row
+_LOCK_ACCOUNT_QUERY = 'SELECT 1 FROM accounts WHERE id = ? FOR NO KEY UPDATE'
+_LOCK_ACCOUNT_BY_ROW_QUERIES = {
+    table: f'SELECT 1 FROM accounts WHERE id = (SELECT account_id FROM {table} WHERE id = ?) FOR NO KEY UPDATE'
+    for table in ACCOUNT_COUNTER_UPDATES
+}
+_REFRESH_COUNTERS_QUERIES = {
+    table: f'UPDATE accounts SET {updates} WHERE id = ?'
+    for table, updates in ACCOUNT_COUNTER_UPDATES.items()
+}
+_REFRESH_COUNTERS_BY_ROW_QUERIES = {
+    table: f'UPDATE accounts SET {updates} WHERE id = (SELECT account_id FROM {table} WHERE id = ?)'
+    for table, updates in ACCOUNT_COUNTER_UPDATES.items()
+}
+
+def _refresh_account_counters(db, table, account_id):
+    """Recompute the denormalized account stats that table feeds.
+
+    On Postgres the account row is locked first, in its own statement, so the
+    recompute's snapshot includes rows committed by writers it waited for;
+    concurrent writes to one account then can't lose each other's rows. (NO
+    KEY UPDATE, unlike FOR UPDATE, doesn't conflict with the key-share locks
+    that child inserts take through their foreign key, so it can't deadlock
+    with them.) SQLite write transactions (BEGIN IMMEDIATE) are already
+    serialized.
+    """
+    if USE_POSTGRES:
+        fetchval(db, _LOCK_ACCOUNT_QUERY, (account_id,), prepare=True)
+    execute_query(db, _REFRESH_COUNTERS_QUERIES[table], (account_id,), prepare=True)
+
+def _refresh_account_counters_by_row(db, table, row_id):
+    """Recompute the account stats that table feeds, for the account owning row_id."""
+    if USE_POSTGRES:
+        fetchval(db, _LOCK_ACCOUNT_BY_ROW_QUERIES[table], (row_id,), prepare=True)
+    execute_query(db, _REFRESH_COUNTERS_BY_ROW_QUERIES[table], (row_id,), prepare=True)
 
 # ============================================================================
 # Activity Functions
@@ -115,78 +236,136 @@ def create_activity(account_id, activity_type, description, activity_date=None):
     if activity_date is None:
         activity_date = Config.today().isoformat()
 
-    db = get_db()
-
-    if Config.use_postgres():
-        cursor = execute(db, '''
-            INSERT INTO activities (account_id, activity_type, description, activity_date)
-            VALUES (?, ?, ?, ?) RETURNING id
-        ''', (account_id, activity_type, description, activity_date))
-        activity_id = get_last_insert_id(db, cursor)
-    else:
-        cursor = execute(db, '''
-            INSERT INTO activities (account_id, activity_type, description, activity_date)
-            VALUES (?, ?, ?, ?)
-        ''', (account_id, activity_type, description, activity_date))
-        activity_id = get_last_insert_id(db, cursor)
+    with db_connection(autocommit=True) as db:
+        if USE_POSTGRES:
+            # Insert and mark the account touched for this date in one round trip
+            activity_id = fetchval(db, '''
+                WITH ins AS (
+                    INSERT INTO activities (account_id, activity_type, description, activity_date)
+                    VALUES (?, ?, ?, ?) RETURNING id
+                ), touch AS (
+                    INSERT INTO daily_touches (account_id, touch_date)
+                    VALUES (?, ?) ON CONFLICT DO NOTHING
+                ), latest AS (
+                    UPDATE accounts SET last_activity_date = ?, last_activity_description = ?
+                    WHERE id = ? AND (last_activity_date IS NULL OR last_activity_date <= ?)
+                )
+                SELECT id FROM ins
+            ''', (account_id, activity_type, description, activity_date, account_id, activity_date,
+                  activity_date, description, account_id, activity_date), prepare=True)
+        else:
+            # SQLite has no data-modifying CTEs; both inserts share one transaction
+            activity_id = insert_returning_id(db, '''
+                INSERT INTO activities (account_id, activity_type, description, activity_date)
+                VALUES (?, ?, ?, ?)
+            ''', (account_id, activity_type, description, activity_date))
 
-    # Mark account as touched for this date
-    try:
-        if Config.use_postgres():
+            # Mark account as touched for this date
             execute(db, '''
                 INSERT INTO daily_touches (account_id, touch_date)
                 VALUES (?, ?) ON CONFLICT DO NOTHING
             ''', (account_id, activity_date))
-        else:
+
+            # The newest activity (ties go to the later insert) is the account's latest
             execute(db, '''
-                INSERT INTO daily_touches (account_id, touch_date)
-                VALUES (?, ?)
-            ''', (account_id, activity_date))
-    except Exception:
-        pass
+                UPDATE accounts SET last_activity_date = ?, last_activity_description = ?
+                WHERE id = ? AND (last_activity_date IS NULL OR last_activity_date <= ?)
+            ''', (activity_date, description, account_id, activity_date))
+
+        db.commit()
+        _bump_data_generation()
 
-    db.commit()
-    close_db(db)
     return activity_id
 
-def get_account_activities(account_id, limit=50, offset=0):
-    """Get activities for an account."""
-    db = get_db()
+def create_activities_bulk(activities):
+    """Create many activities in one transaction and mark their accounts touched.
+
+    Args:
+        activities: Iterable of (account_id, activity_type, description, activity_date).
+
+    Returns:
+        Number of activities created.
+    """
+    rows = list(activities)
+    if not rows:
+        return 0
+
+    with db_connection() as db:
+        executemany(db, '''
+            INSERT INTO activities (account_id, activity_type, description, activity_date)
+            VALUES (?, ?, ?, ?)
+        ''', rows)
+        executemany(db, '''
+            INSERT INTO daily_touches (account_id, touch_date)
+            VALUES (?, ?) ON CONFLICT DO NOTHING
+        ''', sorted({(row[0], row[3]) for row in rows}))
+        for account_id in sorted({row[0] for row in rows}):
+            _refresh_account_counters(db, 'activities', account_id)
+
+        db.commit()
+        _bump_data_generation()
 
-    activities = fetchall(db, '''
+    return len(rows)
+
+def iter_account_activities(account_id, limit=50, after=None, batch_size=256):
+    """Yield activities for an account in batches of up to batch_size rows.
+
+    Pages are keyset-based: pass the (activity_date, created_at, id) of the
+    last row already seen as after to continue from it. With limit=None
+    every remaining activity is streamed through a server-side cursor.
+    """
+    if after is None:
+        seek = ''
+        params = (account_id,)
+    else:
+        seek = 'AND (activity_date, created_at, id) < (?, ?, ?)'
+        params = (account_id, *after)
+
+    query = f'''
         SELECT id, account_id, activity_type, description, activity_date, created_at
         FROM activities
-        WHERE account_id = ?
-        ORDER BY activity_date DESC, created_at DESC
-        LIMIT ? OFFSET ?
-    ''', (account_id, limit, offset))
+        WHERE account_id = ? {seek}
+        ORDER BY activity_date DESC, created_at DESC, id DESC
+    '''
 
-    close_db(db)
-    return activities
+    with db_connection() as db:
+        if limit is None:
+            yield from iter_rows(db, query, params, batch_size)
+            return
+
+        cursor = execute_query(db, query + 'LIMIT ?', params + (limit,), prepare=True)
+        cursor.arraysize = batch_size
+
+        # Close the cursor even if the consumer stops early (e.g. a client
+        # disconnecting mid-stream closes this generator at a yield)
+        try:
+            rows = cursor.fetchmany()
+            while rows:
+                yield rows_as_dicts(cursor, rows)
+                rows = cursor.fetchmany()
+        finally:
+            cursor.close()
+
+def get_account_activities(account_id, limit=50, after=None):
+    """Get activities for an account."""
+    return [
+        activity
+        for batch in iter_account_activities(account_id, limit, after)
+        for activity in batch
+    ]
 
 def mark_touched(account_id, touch_date=None):
     """Mark an account as touched for a specific date."""
     if touch_date is None:
         touch_date = Config.today().isoformat()
 
-    db = get_db()
-
-    try:
-        if Config.use_postgres():
-            execute(db, '''
-                INSERT INTO daily_touches (account_id, touch_date)
-                VALUES (?, ?) ON CONFLICT DO NOTHING
-            ''', (account_id, touch_date))
-        else:
-            execute(db, '''
-                INSERT INTO daily_touches (account_id, touch_date)
-                VALUES (?, ?)
-            ''', (account_id, touch_date))
+    with db_connection(autocommit=True) as db:
+        execute(db, '''
+            INSERT INTO daily_touches (account_id, touch_date)
+            VALUES (?, ?) ON CONFLICT DO NOTHING
+        ''', (account_id, touch_date), prepare=True)
         db.commit()
-    except Exception:
-        pass
-
-    close_db(db)
+        _bump_data_generation()
 
 # ============================================================================
 # Task Functions
@@ -194,90 +373,81 @@ def mark_touched(account_id, touch_date=None):
 
 def create_task(account_id, title, description=None, due_date=None):
     """Create a new task."""
-    db = get_db()
-
-    if Config.use_postgres():
-        cursor = execute(db, '''
-            INSERT INTO tasks (account_id, title, description, due_date)
-            VALUES (?, ?, ?, ?) RETURNING id
-        ''', (account_id, title, description, due_date))
-        task_id = get_last_insert_id(db, cursor)
-    else:
-        cursor = execute(db, '''
+    with db_connection() as db:
+        task_id = insert_returning_id(db, '''
             INSERT INTO tasks (account_id, title, description, due_date)
             VALUES (?, ?, ?, ?)
-        ''', (account_id, title, description, due_date))
-        task_id = get_last_insert_id(db, cursor)
+        ''', (account_id, title, description, due_date), prepare=True)
+
+        _refresh_account_counters(db, 'tasks', account_id)
+
+        db.commit()
+        _bump_data_generation()
 
-    db.commit()
-    close_db(db)
     return task_id
 
 def update_task(task_id, title=None, description=None, due_date=None, status=None):
-    """Update a task."""
-    db = get_db()
-
-    task = fetchone(db, 'SELECT * FROM tasks WHERE id = ?', (task_id,))
-    if not task:
-        close_db(db)
-        return None
-
-    new_title = title if title is not None else task['title']
-    new_description = description if description is not None else task['description']
-    new_due_date = due_date if due_date is not None else task['due_date']
-    new_status = status if status is not None else task['status']
-
-    completed_at = None
-    if new_status == 'completed' and task['status'] != 'completed':
-        completed_at = Config.now().isoformat()
-    elif new_status != 'completed':
-        completed_at = None
-    else:
-        completed_at = task['completed_at']
+    """Update a task. Fields passed as None keep their current value."""
+    with db_connection() as db:
+        # completed_at is set when the task becomes completed, cleared when it
+        # leaves that status, and otherwise kept
+        cursor = execute(db, '''
+            UPDATE tasks
+            SET title = COALESCE(?, title),
+                description = COALESCE(?, description),
+                due_date = COALESCE(?, due_date),
+                status = COALESCE(?, status),
+                completed_at = CASE
+                    WHEN COALESCE(?, status) <> 'completed' THEN NULL
+                    WHEN status <> 'completed' THEN ?
+                    ELSE completed_at
+                END
+            WHERE id = ?
+        ''', (title, description, due_date, status, status, Config.now().isoformat(), task_id))
+        updated = cursor.rowcount
 
-    execute(db, '''
-        UPDATE tasks
-        SET title = ?, description = ?, due_date = ?, status = ?, completed_at = ?
-        WHERE id = ?
-    ''', (new_title, new_description, new_due_date, new_status, completed_at, task_id))
+        if updated and status is not None:
+            _refresh_account_counters_by_row(db, 'tasks', task_id)
 
-    db.commit()
-    close_db(db)
-    return task_id
+        db.commit()
+        _bump_data_generation()
+
+    return task_id if updated else None
 
 def delete_task(task_id):
     """Delete a task."""
-    db = get_db()
-    execute(db, 'DELETE FROM tasks WHERE id = ?', (task_id,))
-    db.commit()
-    close_db(db)
+    with db_connection() as db:
+        account_id = fetchval(db, 'SELECT account_id FROM tasks WHERE id = ?', (task_id,))
+        if account_id is not None:
+            execute(db, 'DELETE FROM tasks WHERE id = ?', (task_id,))
+            _refresh_account_counters(db, 'tasks', account_id)
+            db.commit()
+            _bump_data_generation()
 
 def get_account_tasks(account_id):
     """Get all tasks for an account."""
-    db = get_db()
-
-    if Config.use_postgres():
-        tasks = fetchall(db, '''
-            SELECT id, account_id, title, description, due_date, status, created_at, completed_at
-            FROM tasks
-            WHERE account_id = ?
-            ORDER BY
-                CASE WHEN status = 'open' THEN 0 ELSE 1 END,
-                due_date ASC NULLS LAST,
-                created_at DESC
-        ''', (account_id,))
-    else:
-        tasks = fetchall(db, '''
-            SELECT id, account_id, title, description, due_date, status, created_at, completed_at
-            FROM tasks
-            WHERE account_id = ?
-            ORDER BY
-                CASE WHEN status = 'open' THEN 0 ELSE 1 END,
-                due_date ASC NULLS LAST,
-                created_at DESC
-        ''', (account_id,))
+    with db_connection() as db:
+        if USE_POSTGRES:
+            tasks = fetchall(db, '''
+                SELECT id, account_id, title, description, due_date, status, created_at, completed_at
+                FROM tasks
+                WHERE account_id = ?
+                ORDER BY
+                    CASE WHEN status = 'open' THEN 0 ELSE 1 END,
+                    due_date ASC NULLS LAST,
+                    created_at DESC
+            ''', (account_id,), prepare=True)
+        else:
+            tasks = fetchall(db, '''
+                SELECT id, account_id, title, description, due_date, status, created_at, completed_at
+                FROM tasks
+                WHERE account_id = ?
+                ORDER BY
+                    CASE WHEN status = 'open' THEN 0 ELSE 1 END,
+                    due_date ASC NULLS LAST,
+                    created_at DESC
+            ''', (account_id,), prepare=True)
 
-    close_db(db)
     return tasks
 
 # ============================================================================
@@ -289,144 +459,136 @@ def create_note(account_id, content, note_date=None):
     if note_date is None:
         note_date = Config.today().isoformat()
 
-    db = get_db()
+    with db_connection(autocommit=True) as db:
+        if USE_POSTGRES:
+            # Insert and mark the account touched for this date in one round trip
+            note_id = fetchval(db, '''
+                WITH ins AS (
+                    INSERT INTO notes (account_id, content, note_date)
+                    VALUES (?, ?, ?) RETURNING id
+                ), touch AS (
+                    INSERT INTO daily_touches (account_id, touch_date)
+                    VALUES (?, ?) ON CONFLICT DO NOTHING
+                )
+                SELECT id FROM ins
+            ''', (account_id, content, note_date, account_id, note_date), prepare=True)
+        else:
+            # SQLite has no data-modifying CTEs; both inserts share one transaction
+            note_id = insert_returning_id(db, '''
+                INSERT INTO notes (account_id, content, note_date)
+                VALUES (?, ?, ?)
+            ''', (account_id, content, note_date))
 
-    if Config.use_postgres():
-        cursor = execute(db, '''
-            INSERT INTO notes (account_id, content, note_date)
-            VALUES (?, ?, ?) RETURNING id
-        ''', (account_id, content, note_date))
-        note_id = get_last_insert_id(db, cursor)
-    else:
-        cursor = execute(db, '''
-            INSERT INTO notes (account_id, content, note_date)
-            VALUES (?, ?, ?)
-        ''', (account_id, content, note_date))
-        note_id = get_last_insert_id(db, cursor)
-
-    # Mark account as touched for this date
-    try:
-        if Config.use_postgres():
+            # Mark account as touched for this date
             execute(db, '''
                 INSERT INTO daily_touches (account_id, touch_date)
                 VALUES (?, ?) ON CONFLICT DO NOTHING
             ''', (account_id, note_date))
-        else:
-            execute(db, '''
-                INSERT INTO daily_touches (account_id, touch_date)
-                VALUES (?, ?)
-            ''', (account_id, note_date))
-    except Exception:
-        pass
 
-    db.commit()
-    close_db(db)
-    return note_id
+        db.commit()
+        _bump_data_generation()
 
-def get_account_notes(account_id):
-    """Get all notes for an account."""
-    db = get_db()
+    return note_id
 
-    notes = fetchall(db, '''
-        SELECT id, account_id, content, note_date, created_at
-        FROM notes
-        WHERE account_id = ?
-        ORDER BY note_date DESC, created_at DESC
-    ''', (account_id,))
+def _fetch_account_notes(account_id):
+    """Read all notes for an account."""
+    with db_connection() as db:
+        notes = fetchall(db, '''
+            SELECT id, account_id, content, note_date, created_at
+            FROM notes
+            WHERE account_id = ?
+            ORDER BY note_date DESC, created_at DESC
+        ''', (account_id,), prepare=True)
 
-    close_db(db)
     return notes
 
+def get_account_notes(account_id):
+    """Get all notes for an account."""
+    return _cached_account_detail('notes', account_id, _fetch_account_notes)
+
 # ============================================================================
 # Deal Functions
 # ============================================================================
 
 def create_deal(account_id, name, stage='discovery', value=None, products=None, expected_close_date=None, notes=None):
     """Create a new deal."""
-    db = get_db()
+    with db_connection() as db:
+        deal_id = insert_returning_id(db, '''
+            INSERT INTO deals (account_id, name, stage, stage_rank, value, products, expected_close_date, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (account_id, name, stage, DEAL_STAGE_RANKS.get(stage), value, products,
+              expected_close_date, notes), prepare=True)
 
-    if Config.use_postgres():
-        cursor = execute(db, '''
-            INSERT INTO deals (account_id, name, stage, value, products, expected_close_date, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id
-        ''', (account_id, name, stage, value, products, expected_close_date, notes))
-        deal_id = get_last_insert_id(db, cursor)
-    else:
-        cursor = execute(db, '''
-            INSERT INTO deals (account_id, name, stage, value, products, expected_close_date, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (account_id, name, stage, value, products, expected_close_date, notes))
-        deal_id = get_last_insert_id(db, cursor)
+        _refresh_account_counters(db, 'deals', account_id)
+
+        db.commit()
+        _bump_data_generation()
 
-    db.commit()
-    close_db(db)
     return deal_id
 
+def _fetch_account_deals(account_id):
+    """Read all deals for an account."""
+    with db_connection() as db:
+        deals = fetchall(db, '''
+            SELECT id, account_id, name, stage, value, products, expected_close_date, notes,
+                   created_at, updated_at, closed_at
+            FROM deals
+            WHERE account_id = ?
+            ORDER BY stage_rank ASC NULLS LAST, created_at DESC
+        ''', (account_id,), prepare=True)
+
+    return deals
+
 def get_account_deals(account_id):
     """Get all deals for an account."""
-    db = get_db()
-
-    deals = fetchall(db, '''
-        SELECT id, account_id, name, stage, value, products, expected_close_date, notes,
-               created_at, updated_at, closed_at
-        FROM deals
-        WHERE account_id = ?
-        ORDER BY
-            CASE WHEN stage IN ('closed_won', 'closed_lost') THEN 1 ELSE 0 END,
-            CASE stage
-                WHEN 'negotiation' THEN 1
-                WHEN 'proposal' THEN 2
-                WHEN 'design' THEN 3
-                WHEN 'discovery' THEN 4
-                ELSE 5
-            END,
-            created_at DESC
-    ''', (account_id,))
-
-    close_db(db)
-    return deals
+    return _cached_account_detail('deals', account_id, _fetch_account_deals)
+
+# Columns update_deal() may change directly
+_DEAL_UPDATE_FIELDS = ('name', 'stage', 'value', 'products', 'expected_close_date', 'notes')
 
 def update_deal(deal_id, **kwargs):
-    """Update a deal."""
-    db = get_db()
-
-    deal = fetchone(db, 'SELECT * FROM deals WHERE id = ?', (deal_id,))
-    if not deal:
-        close_db(db)
-        return None
-
-    new_name = kwargs.get('name', deal['name'])
-    new_stage = kwargs.get('stage', deal['stage'])
-    new_value = kwargs.get('value', deal['value'])
-    new_products = kwargs.get('products', deal['products'])
-    new_close_date = kwargs.get('expected_close_date', deal['expected_close_date'])
-    new_notes = kwargs.get('notes', deal['notes'])
-    updated_at = Config.now().isoformat()
-
-    closed_at = deal['closed_at']
-    if new_stage in ('closed_won', 'closed_lost') and deal['stage'] not in ('closed_won', 'closed_lost'):
-        closed_at = Config.now().isoformat()
-    elif new_stage not in ('closed_won', 'closed_lost'):
-        closed_at = None
-
-    execute(db, '''
-        UPDATE deals
-        SET name = ?, stage = ?, value = ?, products = ?, expected_close_date = ?,
-            notes = ?, updated_at = ?, closed_at = ?
-        WHERE id = ?
-    ''', (new_name, new_stage, new_value, new_products, new_close_date,
-          new_notes, updated_at, closed_at, deal_id))
-
-    db.commit()
-    close_db(db)
-    return deal_id
+    """Update a deal. Only updates fields present in kwargs.
+
+    A field passed as None is cleared; fields not passed are left as is.
+    """
+    fields = [field for field in _DEAL_UPDATE_FIELDS if field in kwargs]
+    now = Config.now().isoformat()
+
+    assignments = [f'{field} = ?' for field in fields] + ['updated_at = ?']
+    params = [kwargs[field] for field in fields] + [now]
+
+    if 'stage' in kwargs:
+        # closed_at is set when the deal closes, cleared when it reopens, and
+        # otherwise kept (stage on the right-hand side is the old value)
+        assignments += ['stage_rank = ?', '''closed_at = CASE
+            WHEN ? NOT IN ('closed_won', 'closed_lost') THEN NULL
+            WHEN stage NOT IN ('closed_won', 'closed_lost') THEN ?
+            ELSE closed_at
+        END''']
+        params += [DEAL_STAGE_RANKS.get(kwargs['stage']), kwargs['stage'], now]
+
+    with db_connection() as db:
+        cursor = execute(db, f'UPDATE deals SET {", ".join(assignments)} WHERE id = ?',
+                         params + [deal_id])
+        updated = cursor.rowcount
+
+        if updated and ('stage' in kwargs or 'value' in kwargs):
+            _refresh_account_counters_by_row(db, 'deals', deal_id)
+
+        db.commit()
+        _bump_data_generation()
+
+    return deal_id if updated else None
 
 def delete_deal(deal_id):
     """Delete a deal."""
-    db = get_db()
-    execute(db, 'DELETE FROM deals WHERE id = ?', (deal_id,))
-    db.commit()
-    close_db(db)
+    with db_connection() as db:
+        account_id = fetchval(db, 'SELECT account_id FROM deals WHERE id = ?', (deal_id,))
+        if account_id is not None:
+            execute(db, 'DELETE FROM deals WHERE id = ?', (deal_id,))
+            _refresh_account_counters(db, 'deals', account_id)
+            db.commit()
+            _bump_data_generation()
 
 # ============================================================================
 # Contact Functions
@@ -434,240 +596,243 @@ def delete_deal(deal_id):
 
 def create_contact(account_id, name, title=None, role=None, email=None, phone=None, notes=None):
     """Create a new contact."""
-    db = get_db()
+    with db_connection() as db:
+        contact_id = insert_returning_id(db, '''
+            INSERT INTO contacts (account_id, name, title, role, role_rank, email, phone, notes)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (account_id, name, title, role, CONTACT_ROLE_RANKS.get(role, CONTACT_OTHER_ROLE_RANK),
+              email, phone, notes), prepare=True)
 
-    if Config.use_postgres():
-        cursor = execute(db, '''
-            INSERT INTO contacts (account_id, name, title, role, email, phone, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?) RETURNING id
-        ''', (account_id, name, title, role, email, phone, notes))
-        contact_id = get_last_insert_id(db, cursor)
-    else:
-        cursor = execute(db, '''
-            INSERT INTO contacts (account_id, name, title, role, email, phone, notes)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (account_id, name, title, role, email, phone, notes))
-        contact_id = get_last_insert_id(db, cursor)
+        _refresh_account_counters(db, 'contacts', account_id)
+
+        db.commit()
+        _bump_data_generation()
 
-    db.commit()
-    close_db(db)
     return contact_id
 
+def _fetch_account_contacts(account_id):
+    """Read all contacts for an account."""
+    with db_connection() as db:
+        contacts = fetchall(db, '''
+            SELECT id, account_id, name, title, role, email, phone, notes, last_contacted, created_at
+            FROM contacts
+            WHERE account_id = ?
+            ORDER BY role_rank, name ASC
+        ''', (account_id,), prepare=True)
+
+    return contacts
+
 def get_account_contacts(account_id):
     """Get all contacts for an account."""
-    db = get_db()
-
-    contacts = fetchall(db, '''
-        SELECT id, account_id, name, title, role, email, phone, notes, last_contacted, created_at
-        FROM contacts
-        WHERE account_id = ?
-        ORDER BY
-            CASE role
-                WHEN 'champion' THEN 1
-                WHEN 'decision_maker' THEN 2
-                WHEN 'technical_eval' THEN 3
-                WHEN 'influencer' THEN 4
-                WHEN 'blocker' THEN 5
-                ELSE 6
-            END,
-            name ASC
-    ''', (account_id,))
-
-    close_db(db)
-    return contacts
+    return _cached_account_detail('contacts', account_id, _fetch_account_contacts)
+
+# Columns update_contact() may change
+_CONTACT_UPDATE_FIELDS = ('name', 'title', 'role', 'email', 'phone', 'notes', 'last_contacted')
 
 def update_contact(contact_id, **kwargs):
-    """Update a contact."""
-    db = get_db()
-
-    contact = fetchone(db, 'SELECT * FROM contacts WHERE id = ?', (contact_id,))
-    if not contact:
-        close_db(db)
-        return None
-
-    new_name = kwargs.get('name', contact['name'])
-    new_title = kwargs.get('title', contact['title'])
-    new_role = kwargs.get('role', contact['role'])
-    new_email = kwargs.get('email', contact['email'])
-    new_phone = kwargs.get('phone', contact['phone'])
-    new_notes = kwargs.get('notes', contact['notes'])
-    new_last_contacted = kwargs.get('last_contacted', contact['last_contacted'])
-
-    execute(db, '''
-        UPDATE contacts
-        SET name = ?, title = ?, role = ?, email = ?, phone = ?, notes = ?, last_contacted = ?
-        WHERE id = ?
-    ''', (new_name, new_title, new_role, new_email, new_phone, new_notes, new_last_contacted, contact_id))
-
-    db.commit()
-    close_db(db)
-    return contact_id
+    """Update a contact. Only updates fields present in kwargs.
+
+    A field passed as None is cleared; fields not passed are left as is.
+    """
+    fields = [field for field in _CONTACT_UPDATE_FIELDS if field in kwargs]
+    assignments = [f'{field} = ?' for field in fields]
+    params = [kwargs[field] for field in fields]
+
+    if 'role' in kwargs:
+        assignments.append('role_rank = ?')
+        params.append(CONTACT_ROLE_RANKS.get(kwargs['role'], CONTACT_OTHER_ROLE_RANK))
+
+    with db_connection(autocommit=True) as db:
+        if fields:
+            cursor = execute(db, f'UPDATE contacts SET {", ".join(assignments)} WHERE id = ?',
+                             params + [contact_id])
+            updated = cursor.rowcount
+        else:
+            updated = fetchval(db, 'SELECT 1 FROM contacts WHERE id = ?', (contact_id,))
+
+        db.commit()
+        _bump_data_generation()
+
+    return contact_id if updated else None
 
 def delete_contact(contact_id):
     """Delete a contact."""
-    db = get_db()
-    execute(db, 'DELETE FROM contacts WHERE id = ?', (contact_id,))
-    db.commit()
-    close_db(db)
+    with db_connection() as db:
+        account_id = fetchval(db, 'SELECT account_id FROM contacts WHERE id = ?', (contact_id,))
+        if account_id is not None:
+            execute(db, 'DELETE FROM contacts WHERE id = ?', (contact_id,))
+            _refresh_account_counters(db, 'contacts', account_id)
+            db.commit()
+            _bump_data_generation()
 
 # ============================================================================
 # Dashboard Functions
 # ============================================================================
 
-def get_dashboard_stats():
-    """Get dashboard summary statistics including pipeline and renewal data."""
-    db = get_db()
-    today = Config.today()
+def _fetch_dashboard_stats(db, today):
+    """Run the dashboard summary queries on an open connection."""
     today_str = today.isoformat()
 
     # Calculate start of current week (Monday)
     week_start = (today - timedelta(days=today.weekday())).isoformat()
 
-    total_accounts = fetchone(db, 'SELECT COUNT(*) as count FROM accounts')['count']
-
-    touched_today = fetchone(db, '''
-        SELECT COUNT(DISTINCT account_id) as count
-        FROM daily_touches
-        WHERE touch_date = ?
-    ''', (today_str,))['count']
-
-    total_open_tasks = fetchone(db, '''
-        SELECT COUNT(*) as count
-        FROM tasks
-        WHERE status = 'open'
-    ''')['count']
-
-    overdue_tasks = fetchone(db, '''
-        SELECT COUNT(*) as count
-        FROM tasks
-        WHERE status = 'open' AND due_date < ?
-    ''', (today_str,))['count']
-
-    # Weekly touch count (distinct accounts touched this week)
-    weekly_touches = fetchone(db, '''
-        SELECT COUNT(DISTINCT account_id) as count
-        FROM daily_touches
-        WHERE touch_date >= ?
-    ''', (week_start,))['count']
-
-    # Weekly activity count
-    weekly_activities = fetchone(db, '''
-        SELECT COUNT(*) as count
-        FROM activities
-        WHERE activity_date >= ?
-    ''', (week_start,))['count']
-
-    # Total pipeline value (active deals only)
-    pipeline_result = fetchone(db, '''
-        SELECT COALESCE(SUM(value), 0) as total
-        FROM deals
-        WHERE stage NOT IN ('closed_won', 'closed_lost')
-    ''')
-    total_pipeline = float(pipeline_result['total']) if pipeline_result['total'] else 0
-
-    # Upcoming renewals within 30 days
     thirty_days = (today + timedelta(days=30)).isoformat()
-    upcoming_renewals = fetchone(db, '''
-        SELECT COUNT(*) as count
-        FROM accounts
-        WHERE renewal_date IS NOT NULL AND renewal_date <= ? AND renewal_date >= ?
-    ''', (thirty_days, today_str))['count']
+
+    # All counters come back from one round trip as scalar subqueries
+    stats = fetchone(db, '''
+        SELECT
+            (SELECT COUNT(*) FROM accounts) as total_accounts,
+            (SELECT COUNT(DISTINCT account_id) FROM daily_touches
+             WHERE touch_date = ?) as touched_today,
+            (SELECT COUNT(*) FROM tasks WHERE status = 'open') as total_open_tasks,
+            (SELECT COUNT(*) FROM tasks
+             WHERE status = 'open' AND due_date < ?) as overdue_tasks,
+            -- Weekly touch count (distinct accounts touched this week)
+            (SELECT COUNT(DISTINCT account_id) FROM daily_touches
+             WHERE touch_date >= ?) as weekly_touches,
+            (SELECT COUNT(*) FROM activities
+             WHERE activity_date >= ?) as weekly_activities,
+            -- Total pipeline value (active deals only)
+            (SELECT COALESCE(SUM(value), 0) FROM deals
+             WHERE stage NOT IN ('closed_won', 'closed_lost')) as total_pipeline,
+            -- Upcoming renewals within 30 days
+            (SELECT COUNT(*) FROM accounts
+             WHERE renewal_date IS NOT NULL AND renewal_date <= ? AND renewal_date >= ?) as upcoming_renewals
+    ''', (today_str, today_str, week_start, week_start, thirty_days, today_str), prepare=True)
 
     # Touch streak - consecutive days with at least one activity
     streak = _calculate_streak(db, today)
 
-    close_db(db)
-
     return {
-        'total_accounts': total_accounts,
-        'touched_today': touched_today,
-        'untouched_today': total_accounts - touched_today,
-        'total_open_tasks': total_open_tasks,
-        'overdue_tasks': overdue_tasks,
-        'weekly_touches': weekly_touches,
-        'weekly_activities': weekly_activities,
-        'total_pipeline': total_pipeline,
-        'upcoming_renewals': upcoming_renewals,
+        'total_accounts': stats['total_accounts'],
+        'touched_today': stats['touched_today'],
+        'untouched_today': stats['total_accounts'] - stats['touched_today'],
+        'total_open_tasks': stats['total_open_tasks'],
+        'overdue_tasks': stats['overdue_tasks'],
+        'weekly_touches': stats['weekly_touches'],
+        'weekly_activities': stats['weekly_activities'],
+        'total_pipeline': float(stats['total_pipeline']) if stats['total_pipeline'] else 0,
+        'upcoming_renewals': stats['upcoming_renewals'],
         'touch_streak': streak
     }
 
-def _calculate_streak(db, today):
-    """Calculate consecutive days with logged activity."""
-    streak = 0
-    check_date = today
-
-    for _ in range(365):  # Max 1 year lookback
-        result = fetchone(db, '''
-            SELECT COUNT(*) as count
-            FROM activities
-            WHERE activity_date = ?
-        ''', (check_date.isoformat(),))
-
-        if result['count'] > 0:
-            streak += 1
-            check_date = check_date - timedelta(days=1)
-        else:
-            break
+def get_dashboard_stats(today=None):
+    """Get dashboard summary statistics including pipeline and renewal data."""
+    if today is None:
+        today = Config.today()
+
+    with db_connection() as db:
+        stats = _fetch_dashboard_stats(db, today)
+
+    return stats
 
-    return streak
+def get_dashboard_bundle(today=None, as_json=False):
+    """Get the account list, dashboard stats and sync status in one go.
+
+    All three run back to back on a single read-only connection, so a page
+    load costs one checkout instead of three. as_json is passed through to
+    the account list as in get_accounts_with_summary().
+
+    Returns:
+        Tuple of (accounts, touched_count, total_count, stats, sync_status).
+    """
+    if today is None:
+        today = Config.today()
+
+    with db_connection(autocommit=True) as db:
+        accounts, touched_count, total_count = _fetch_accounts_with_summary(
+            db, today.isoformat(), as_json
+        )
+        stats = _fetch_dashboard_stats(db, today)
+        sync_status = _fetch_sync_status(db)
+
+    return accounts, touched_count, total_count, stats, sync_status
+
+# Gaps and islands: numbering distinct dates newest first, date + row number
+# is the same for every day in an unbroken run, and equals today + 1 only for
+# the run that includes today
+if USE_POSTGRES:
+    _STREAK_DAY_PLUS_RANK = 'activity_date + CAST(ROW_NUMBER() OVER (ORDER BY activity_date DESC) AS INTEGER)'
+    _STREAK_TODAY_PLUS_ONE = 'CAST(? AS DATE) + 1'
+else:
+    _STREAK_DAY_PLUS_RANK = 'julianday(activity_date) + ROW_NUMBER() OVER (ORDER BY activity_date DESC)'
+    _STREAK_TODAY_PLUS_ONE = 'julianday(?) + 1'
+
+_STREAK_QUERY = f'''
+    WITH days AS (
+        SELECT DISTINCT activity_date
+        FROM activities
+        WHERE activity_date <= ? AND activity_date > ?
+    ), runs AS (
+        SELECT {_STREAK_DAY_PLUS_RANK} AS run
+        FROM days
+    )
+    SELECT COUNT(*) FROM runs WHERE run = {_STREAK_TODAY_PLUS_ONE}
+'''
+
+def _calculate_streak(db, today):
+    """Calculate consecutive days with logged activity, ending today (max 365)."""
+    today_str = today.isoformat()
+    year_ago = (today - timedelta(days=365)).isoformat()
+    return fetchval(db, _STREAK_QUERY, (today_str, year_ago, today_str), prepare=True)
 
 # ============================================================================
 # Sync Functions
 # ============================================================================
 
-def get_unsynced_activities():
-    """Get activities that haven't been synced to Google Sheets."""
-    db = get_db()
+def _iter_unsynced(query, batch_size):
+    """Stream an unsynced-rows query in batches on its own connection."""
+    with db_connection() as db:
+        yield from iter_rows(db, query, None, batch_size)
 
-    activities = fetchall(db, '''
+def iter_unsynced_activities(batch_size=500):
+    """Yield activities that haven't been synced to Google Sheets, in batches."""
+    return _iter_unsynced('''
         SELECT a.id, a.activity_type, a.description, a.activity_date, a.created_at,
                acc.name as account_name
         FROM activities a
         JOIN accounts acc ON a.account_id = acc.id
         WHERE a.synced_to_sheets = FALSE
         ORDER BY a.activity_date DESC
-    ''')
-
-    close_db(db)
-    return activities
+    ''', batch_size)
 
-def get_unsynced_tasks():
-    """Get tasks that haven't been synced to Google Sheets."""
-    db = get_db()
+def get_unsynced_activities():
+    """Get activities that haven't been synced to Google Sheets."""
+    return [row for batch in iter_unsynced_activities() for row in batch]
 
-    tasks = fetchall(db, '''
+def iter_unsynced_tasks(batch_size=500):
+    """Yield tasks that haven't been synced to Google Sheets, in batches."""
+    return _iter_unsynced('''
         SELECT t.id, t.title, t.description, t.due_date, t.status, t.created_at, t.completed_at,
                acc.name as account_name
         FROM tasks t
         JOIN accounts acc ON t.account_id = acc.id
         WHERE t.synced_to_sheets = FALSE
         ORDER BY t.created_at DESC
-    ''')
+    ''', batch_size)
 
-    close_db(db)
-    return tasks
-
-def get_unsynced_notes():
-    """Get notes that haven't been synced to Google Sheets."""
-    db = get_db()
+def get_unsynced_tasks():
+    """Get tasks that haven't been synced to Google Sheets."""
+    return [row for batch in iter_unsynced_tasks() for row in batch]
 
-    notes = fetchall(db, '''
+def iter_unsynced_notes(batch_size=500):
+    """Yield notes that haven't been synced to Google Sheets, in batches."""
+    return _iter_unsynced('''
         SELECT n.id, n.content, n.note_date, n.created_at,
                acc.name as account_name
         FROM notes n
         JOIN accounts acc ON n.account_id = acc.id
         WHERE n.synced_to_sheets = FALSE
         ORDER BY n.note_date DESC
-    ''')
-
-    close_db(db)
-    return notes
+    ''', batch_size)
 
-def get_unsynced_deals():
-    """Get deals that haven't been synced to Google Sheets."""
-    db = get_db()
+def get_unsynced_notes():
+    """Get notes that haven't been synced to Google Sheets."""
+    return [row for batch in iter_unsynced_notes() for row in batch]
 
-    deals = fetchall(db, '''
+def iter_unsynced_deals(batch_size=500):
+    """Yield deals that haven't been synced to Google Sheets, in batches."""
+    return _iter_unsynced('''
         SELECT d.id, d.name, d.stage, d.value, d.products, d.expected_close_date,
                d.notes, d.created_at, d.closed_at,
                acc.name as account_name
@@ -675,113 +840,127 @@ def get_unsynced_deals():
         JOIN accounts acc ON d.account_id = acc.id
         WHERE d.synced_to_sheets = FALSE
         ORDER BY d.created_at DESC
-    ''')
+    ''', batch_size)
 
-    close_db(db)
-    return deals
+def get_unsynced_deals():
+    """Get deals that haven't been synced to Google Sheets."""
+    return [row for batch in iter_unsynced_deals() for row in batch]
+
+if USE_POSTGRES:
+    # Join against pages of VALUES rather than one huge id array, so the
+    # planner can probe the primary key
+    _MARK_SYNCED_QUERIES = {
+        table: f'UPDATE {table} SET synced_to_sheets = TRUE FROM (VALUES %s) AS v(id) WHERE {table}.id = v.id'
+        for table in ('activities', 'tasks', 'notes', 'deals')
+    }
+else:
+    # One fixed statement per table, compiled once and reused for every id
+    _MARK_SYNCED_QUERIES = {
+        table: f'UPDATE {table} SET synced_to_sheets = TRUE WHERE id = ?'
+        for table in ('activities', 'tasks', 'notes', 'deals')
+    }
 
-def mark_activities_synced(activity_ids):
-    """Mark activities as synced."""
-    if not activity_ids:
+def mark_synced(activity_ids=(), task_ids=(), note_ids=(), deal_ids=()):
+    """Mark synced rows across all tables in one transaction."""
+    ids_by_table = [
+        (table, list(ids))
+        for table, ids in (
+            ('activities', activity_ids),
+            ('tasks', task_ids),
+            ('notes', note_ids),
+            ('deals', deal_ids),
+        )
+        if ids
+    ]
+    if not ids_by_table:
         return
 
-    db = get_db()
-    if Config.use_postgres():
-        cursor = db.cursor()
-        cursor.execute(
-            'UPDATE activities SET synced_to_sheets = TRUE WHERE id = ANY(%s)',
-            (activity_ids,)
-        )
-        cursor.close()
-    else:
-        placeholders = ','.join('?' * len(activity_ids))
-        db.execute(f'UPDATE activities SET synced_to_sheets = TRUE WHERE id IN ({placeholders})', activity_ids)
-    db.commit()
-    close_db(db)
+    with db_connection() as db:
+        for table, ids in ids_by_table:
+            rows = [(row_id,) for row_id in ids]
+            if USE_POSTGRES:
+                execute_values(db, _MARK_SYNCED_QUERIES[table], rows)
+            else:
+                db.executemany(_MARK_SYNCED_QUERIES[table], rows)
+        db.commit()
+        _bump_data_generation()
+
+def mark_activities_synced(activity_ids):
+    """Mark activities as synced."""
+    mark_synced(activity_ids=activity_ids)
 
 def mark_tasks_synced(task_ids):
     """Mark tasks as synced."""
-    if not task_ids:
-        return
-
-    db = get_db()
-    if Config.use_postgres():
-        cursor = db.cursor()
-        cursor.execute(
-            'UPDATE tasks SET synced_to_sheets = TRUE WHERE id = ANY(%s)',
-            (task_ids,)
-        )
-        cursor.close()
-    else:
-        placeholders = ','.join('?' * len(task_ids))
-        db.execute(f'UPDATE tasks SET synced_to_sheets = TRUE WHERE id IN ({placeholders})', task_ids)
-    db.commit()
-    close_db(db)
+    mark_synced(task_ids=task_ids)
 
 def mark_notes_synced(note_ids):
     """Mark notes as synced."""
-    if not note_ids:
-        return
-
-    db = get_db()
-    if Config.use_postgres():
-        cursor = db.cursor()
-        cursor.execute(
-            'UPDATE notes SET synced_to_sheets = TRUE WHERE id = ANY(%s)',
-            (note_ids,)
-        )
-        cursor.close()
-    else:
-        placeholders = ','.join('?' * len(note_ids))
-        db.execute(f'UPDATE notes SET synced_to_sheets = TRUE WHERE id IN ({placeholders})', note_ids)
-    db.commit()
-    close_db(db)
+    mark_synced(note_ids=note_ids)
 
 def mark_deals_synced(deal_ids):
     """Mark deals as synced."""
-    if not deal_ids:
-        return
+    mark_synced(deal_ids=deal_ids)
 
-    db = get_db()
-    if Config.use_postgres():
-        cursor = db.cursor()
-        cursor.execute(
-            'UPDATE deals SET synced_to_sheets = TRUE WHERE id = ANY(%s)',
-            (deal_ids,)
-        )
-        cursor.close()
-    else:
-        placeholders = ','.join('?' * len(deal_ids))
-        db.execute(f'UPDATE deals SET synced_to_sheets = TRUE WHERE id IN ({placeholders})', deal_ids)
-    db.commit()
-    close_db(db)
+def _fetch_sync_status(db):
+    """Count unsynced items on an open connection."""
+    counts = fetchone(db, '''
+        SELECT
+            (SELECT COUNT(*) FROM activities WHERE synced_to_sheets = FALSE) as activities,
+            (SELECT COUNT(*) FROM tasks WHERE synced_to_sheets = FALSE) as tasks,
+            (SELECT COUNT(*) FROM notes WHERE synced_to_sheets = FALSE) as notes,
+            (SELECT COUNT(*) FROM deals WHERE synced_to_sheets = FALSE) as deals
+    ''', prepare=True)
+
+    return {
+        'unsynced_activities': counts['activities'],
+        'unsynced_tasks': counts['tasks'],
+        'unsynced_notes': counts['notes'],
+        'unsynced_deals': counts['deals'],
+        'total_unsynced': counts['activities'] + counts['tasks'] + counts['notes'] + counts['deals']
+    }
 
 def get_sync_status():
     """Get count of unsynced items."""
-    db = get_db()
-
-    unsynced_activities = fetchone(db,
-        'SELECT COUNT(*) as count FROM activities WHERE synced_to_sheets = FALSE'
-    )['count']
-
-    unsynced_tasks = fetchone(db,
-        'SELECT COUNT(*) as count FROM tasks WHERE synced_to_sheets = FALSE'
-    )['count']
+    with db_connection() as db:
+        status = _fetch_sync_status(db)
+
+    return status
+
+def record_sync_started():
+    """Record that a Sheets sync is running, for every worker to report."""
+    with db_connection() as db:
+        execute(db, '''
+            INSERT INTO sync_state (id, running) VALUES (1, TRUE)
+            ON CONFLICT (id) DO UPDATE SET running = TRUE
+        ''')
+        db.commit()
 
-    unsynced_notes = fetchone(db,
-        'SELECT COUNT(*) as count FROM notes WHERE synced_to_sheets = FALSE'
-    )['count']
+def record_sync_result(result, error):
+    """Record the outcome of a Sheets sync for every worker to report."""
+    with db_connection() as db:
+        execute(db, '''
+            INSERT INTO sync_state (id, running, last_result, last_error, last_ts)
+            VALUES (1, FALSE, ?, ?, ?)
+            ON CONFLICT (id) DO UPDATE SET
+                running = FALSE,
+                last_result = excluded.last_result,
+                last_error = excluded.last_error,
+                last_ts = excluded.last_ts
+        ''', (orjson.dumps(result).decode() if result is not None else None, error,
+              Config.now().isoformat()))
+        db.commit()
 
-    unsynced_deals = fetchone(db,
-        'SELECT COUNT(*) as count FROM deals WHERE synced_to_sheets = FALSE'
-    )['count']
+def get_sync_result():
+    """Get whether a Sheets sync is running and the outcome of the most recent one."""
+    with db_connection() as db:
+        row = fetchone(db, 'SELECT running, last_result, last_error, last_ts FROM sync_state WHERE id = 1')
 
-    close_db(db)
+    if row is None:
+        return {'running': False, 'last_result': None, 'last_error': None, 'last_ts': None}
 
     return {
-        'unsynced_activities': unsynced_activities,
-        'unsynced_tasks': unsynced_tasks,
-        'unsynced_notes': unsynced_notes,
-        'unsynced_deals': unsynced_deals,
-        'total_unsynced': unsynced_activities + unsynced_tasks + unsynced_notes + unsynced_deals
+        'running': bool(row['running']),
+        'last_result': orjson.loads(row['last_result']) if row['last_result'] else None,
+        'last_error': row['last_error'],
+        'last_ts': row['last_ts']
     }
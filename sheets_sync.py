@@ -1,6 +1,8 @@
 """Google Sheets synchronization module for Account Daily Tracker."""
 
 import os
+from contextlib import closing
+from operator import itemgetter
 from datetime import datetime, date
 
 from google.oauth2 import service_account
@@ -12,6 +14,9 @@ import models
 
 def to_str(value):
     """Convert a value to string, handling date/datetime objects."""
+    # Most columns are already text; check that first
+    if type(value) is str:
+        return value
     if value is None:
         return ''
     if isinstance(value, (date, datetime)):
@@ -19,11 +24,44 @@ def to_str(value):
     return str(value)
 
 
+# Per kind of record: (sheet name, mark_synced keyword, headers, row columns, unsynced row source)
+_SHEETS = {
+    'activities': (
+        'Activity Log', 'activity_ids',
+        ['Date', 'Account', 'Activity Type', 'Description', 'Logged At'],
+        ('activity_date', 'account_name', 'activity_type', 'description', 'created_at'),
+        models.iter_unsynced_activities
+    ),
+    'tasks': (
+        'Tasks', 'task_ids',
+        ['Account', 'Task', 'Description', 'Due Date', 'Status', 'Created', 'Completed'],
+        ('account_name', 'title', 'description', 'due_date', 'status', 'created_at', 'completed_at'),
+        models.iter_unsynced_tasks
+    ),
+    'notes': (
+        'Notes', 'note_ids',
+        ['Date', 'Account', 'Note', 'Logged At'],
+        ('note_date', 'account_name', 'content', 'created_at'),
+        models.iter_unsynced_notes
+    ),
+    'deals': (
+        'Deals', 'deal_ids',
+        ['Account', 'Deal Name', 'Stage', 'Value', 'Products', 'Expected Close', 'Notes', 'Created', 'Closed'],
+        ('account_name', 'name', 'stage', 'value', 'products', 'expected_close_date', 'notes',
+         'created_at', 'closed_at'),
+        models.iter_unsynced_deals
+    ),
+}
+
+
 class SheetsSync:
     """Handle synchronization with Google Sheets."""
 
     SCOPES = ['https://www.googleapis.com/auth/spreadsheets']
 
+    # Queued rows (across all sheets) are written once this many accumulate
+    FLUSH_ROWS = 500
+
     def __init__(self, credentials_path, spreadsheet_id):
         """Initialize the Sheets sync with credentials and spreadsheet ID.
 
@@ -33,6 +71,10 @@ class SheetsSync:
         """
         self.spreadsheet_id = spreadsheet_id
         self.service = None
+        # Tab ids by title and tabs known to have headers; the instance
+        # outlives a sync, so these skip the metadata calls on later syncs
+        self._sheet_ids = {}
+        self._headered_sheets = set()
 
         if not spreadsheet_id:
             raise ValueError("Google Sheets spreadsheet ID is not configured")
@@ -48,116 +90,187 @@ class SheetsSync:
         except Exception as e:
             raise RuntimeError(f"Failed to initialize Google Sheets service: {e}")
 
-    def _ensure_sheet_exists(self, sheet_name):
-        """Ensure a sheet/tab exists, create if it doesn't."""
+    def _ensure_sheets_exist(self, sheet_names):
+        """Ensure the given sheets/tabs exist, creating any that don't.
+
+        Returns:
+            Names of the sheets created, which are known to be empty.
+        """
+        missing = [name for name in sheet_names if name not in self._sheet_ids]
+        if not missing:
+            return []
+
         try:
             # Get spreadsheet metadata
             spreadsheet = self.service.spreadsheets().get(
                 spreadsheetId=self.spreadsheet_id
             ).execute()
 
-            sheet_names = [s['properties']['title'] for s in spreadsheet['sheets']]
+            for sheet in spreadsheet['sheets']:
+                self._sheet_ids[sheet['properties']['title']] = sheet['properties']['sheetId']
 
-            if sheet_name not in sheet_names:
-                # Create the sheet
-                request = {
-                    'addSheet': {
-                        'properties': {
-                            'title': sheet_name
-                        }
-                    }
-                }
-                self.service.spreadsheets().batchUpdate(
+            missing = [name for name in missing if name not in self._sheet_ids]
+            if missing:
+                # Create all missing sheets in one request
+                requests = [{'addSheet': {'properties': {'title': name}}} for name in missing]
+                result = self.service.spreadsheets().batchUpdate(
                     spreadsheetId=self.spreadsheet_id,
-                    body={'requests': [request]}
+                    body={'requests': requests}
                 ).execute()
+                for name, reply in zip(missing, result['replies']):
+                    self._sheet_ids[name] = reply['addSheet']['properties']['sheetId']
 
-        except HttpError as e:
-            print(f"Error ensuring sheet exists: {e}")
-
-    def _append_rows(self, sheet_name, rows):
-        """Append rows to a sheet."""
-        if not rows:
-            return 0
+            return missing
 
-        try:
-            self._ensure_sheet_exists(sheet_name)
+        except HttpError as e:
+            print(f"Error ensuring sheets exist: {e}")
+            return []
 
-            body = {'values': rows}
-            result = self.service.spreadsheets().values().append(
-                spreadsheetId=self.spreadsheet_id,
-                range=f'{sheet_name}!A1',
-                valueInputOption='RAW',
-                insertDataOption='INSERT_ROWS',
-                body=body
-            ).execute()
+    def _forget_sheet(self, sheet_name):
+        """Drop what is cached about a sheet so it is checked again."""
+        self._sheet_ids.pop(sheet_name, None)
+        self._headered_sheets.discard(sheet_name)
 
-            return result.get('updates', {}).get('updatedRows', 0)
+    def _setup_headers(self, kinds):
+        """Set up headers for the sheets of the given kinds that are empty."""
+        sheets = [_SHEETS[kind] for kind in kinds if _SHEETS[kind][0] not in self._headered_sheets]
+        if not sheets:
+            return
 
-        except HttpError as e:
-            print(f"Error appending rows to {sheet_name}: {e}")
-            return 0
+        created = self._ensure_sheets_exist([sheet[0] for sheet in sheets])
+        sheets = [sheet for sheet in sheets if sheet[0] in self._sheet_ids]
+        if not sheets:
+            return
 
-    def _setup_headers(self, sheet_name, headers):
-        """Set up headers for a sheet if it's empty."""
         try:
-            self._ensure_sheet_exists(sheet_name)
-
-            # Check if sheet has data
-            result = self.service.spreadsheets().values().get(
-                spreadsheetId=self.spreadsheet_id,
-                range=f'{sheet_name}!A1:A1'
-            ).execute()
-
-            if not result.get('values'):
-                # Sheet is empty, add headers
-                body = {'values': [headers]}
-                self.service.spreadsheets().values().update(
+            # Sheets just created are empty; only pre-existing ones need checking
+            empty = [sheet for sheet in sheets if sheet[0] in created]
+            existing = [sheet for sheet in sheets if sheet[0] not in created]
+            if existing:
+                # Check every sheet for data with one read
+                result = self.service.spreadsheets().values().batchGet(
+                    spreadsheetId=self.spreadsheet_id,
+                    ranges=[f'{sheet[0]}!A1:A1' for sheet in existing]
+                ).execute()
+                empty += [
+                    sheet for sheet, value_range in zip(existing, result.get('valueRanges', []))
+                    if not value_range.get('values')
+                ]
+
+            data = [{'range': f'{sheet[0]}!A1', 'values': [sheet[2]]} for sheet in empty]
+            if data:
+                # Add headers to all empty sheets with one write
+                self.service.spreadsheets().values().batchUpdate(
                     spreadsheetId=self.spreadsheet_id,
-                    range=f'{sheet_name}!A1',
-                    valueInputOption='RAW',
-                    body=body
+                    body={'valueInputOption': 'RAW', 'data': data}
                 ).execute()
 
+            self._headered_sheets.update(sheet[0] for sheet in sheets)
+
         except HttpError as e:
-            print(f"Error setting up headers for {sheet_name}: {e}")
+            print(f"Error setting up headers: {e}")
+            for sheet in sheets:
+                self._forget_sheet(sheet[0])
 
-    def sync_activities(self):
-        """Sync unsynced activities to Google Sheets.
+    def _flush_rows(self, queue, results):
+        """Append all queued rows, for every sheet, in one batchUpdate request.
 
-        Returns:
-            Number of activities synced.
+        Args:
+            queue: List of (kind, rows, ids); emptied on return.
+            results: Dict of kind -> [rows appended, ids appended], updated
+                for the rows written.
         """
-        activities = models.get_unsynced_activities()
+        # Sheets seen for the first time are set up together before the write
+        self._setup_headers(dict.fromkeys(kind for kind, _, _ in queue))
+
+        requests = []
+        written = []
+        for kind, rows, ids in queue:
+            sheet_name = _SHEETS[kind][0]
+            sheet_id = self._sheet_ids.get(sheet_name)
+            if sheet_id is None:
+                print(f"Skipping {len(rows)} rows for missing sheet {sheet_name}")
+                continue
+
+            # appendCells writes after the last row with data, like values.append
+            requests.append({
+                'appendCells': {
+                    'sheetId': sheet_id,
+                    'rows': [
+                        {'values': [{'userEnteredValue': {'stringValue': value}} for value in row]}
+                        for row in rows
+                    ],
+                    'fields': 'userEnteredValue'
+                }
+            })
+            written.append((kind, rows, ids))
+        queue.clear()
 
-        if not activities:
-            return 0
+        if not requests:
+            return
+
+        try:
+            # The requests of one batchUpdate are applied all or nothing
+            self.service.spreadsheets().batchUpdate(
+                spreadsheetId=self.spreadsheet_id,
+                body={'requests': requests}
+            ).execute()
+        except HttpError as e:
+            print(f"Error appending rows: {e}")
+            # A tab may have been deleted or renamed; check them again next time
+            for kind, _, _ in written:
+                self._forget_sheet(_SHEETS[kind][0])
+            return
 
-        # Set up headers
-        headers = ['Date', 'Account', 'Activity Type', 'Description', 'Logged At']
-        self._setup_headers('Activity Log', headers)
+        for kind, rows, ids in written:
+            results[kind][0] += len(rows)
+            results[kind][1].extend(ids)
 
-        # Prepare rows
-        rows = []
-        activity_ids = []
+    def _sync(self, kinds):
+        """Append unsynced rows of the given kinds and mark them synced.
 
-        for activity in activities:
-            rows.append([
-                to_str(activity['activity_date']),
-                to_str(activity['account_name']),
-                to_str(activity['activity_type']),
-                to_str(activity['description']),
-                to_str(activity['created_at'])
-            ])
-            activity_ids.append(activity['id'])
+        Rows are read in batches and queued across sheets, so a small
+        backlog goes out in a single request. Appended rows are marked
+        together in one transaction at the end, including when a later
+        write fails.
 
-        # Append to sheet
-        synced = self._append_rows('Activity Log', rows)
+        Returns:
+            Dict of kind -> number of rows synced.
+        """
+        results = {kind: [0, []] for kind in kinds}
+        queue = []
+        queued = 0
+        try:
+            for kind in kinds:
+                columns, source = _SHEETS[kind][3:]
+                get_columns = itemgetter(*columns)
+
+                # Close the generator (and release its database cursor) even on error
+                with closing(source()) as batches:
+                    for batch in batches:
+                        queue.append((
+                            kind,
+                            [[to_str(value) for value in get_columns(row)] for row in batch],
+                            [row['id'] for row in batch]
+                        ))
+                        queued += len(batch)
+                        if queued >= self.FLUSH_ROWS:
+                            self._flush_rows(queue, results)
+                            queued = 0
+
+            self._flush_rows(queue, results)
+        finally:
+            models.mark_synced(**{_SHEETS[kind][1]: ids for kind, (_, ids) in results.items()})
+
+        return {kind: synced for kind, (synced, _) in results.items()}
 
-        if synced > 0:
-            models.mark_activities_synced(activity_ids)
+    def sync_activities(self):
+        """Sync unsynced activities to Google Sheets.
 
-        return synced
+        Returns:
+            Number of activities synced.
+        """
+        return self._sync(['activities'])['activities']
 
     def sync_tasks(self):
         """Sync unsynced tasks to Google Sheets.
@@ -165,38 +278,7 @@ class SheetsSync:
         Returns:
             Number of tasks synced.
         """
-        tasks = models.get_unsynced_tasks()
-
-        if not tasks:
-            return 0
-
-        # Set up headers
-        headers = ['Account', 'Task', 'Description', 'Due Date', 'Status', 'Created', 'Completed']
-        self._setup_headers('Tasks', headers)
-
-        # Prepare rows
-        rows = []
-        task_ids = []
-
-        for task in tasks:
-            rows.append([
-                to_str(task['account_name']),
-                to_str(task['title']),
-                to_str(task['description']),
-                to_str(task['due_date']),
-                to_str(task['status']),
-                to_str(task['created_at']),
-                to_str(task['completed_at'])
-            ])
-            task_ids.append(task['id'])
-
-        # Append to sheet
-        synced = self._append_rows('Tasks', rows)
-
-        if synced > 0:
-            models.mark_tasks_synced(task_ids)
-
-        return synced
+        return self._sync(['tasks'])['tasks']
 
     def sync_notes(self):
         """Sync unsynced notes to Google Sheets.
@@ -204,35 +286,7 @@ class SheetsSync:
         Returns:
             Number of notes synced.
         """
-        notes = models.get_unsynced_notes()
-
-        if not notes:
-            return 0
-
-        # Set up headers
-        headers = ['Date', 'Account', 'Note', 'Logged At']
-        self._setup_headers('Notes', headers)
-
-        # Prepare rows
-        rows = []
-        note_ids = []
-
-        for note in notes:
-            rows.append([
-                to_str(note['note_date']),
-                to_str(note['account_name']),
-                to_str(note['content']),
-                to_str(note['created_at'])
-            ])
-            note_ids.append(note['id'])
-
-        # Append to sheet
-        synced = self._append_rows('Notes', rows)
-
-        if synced > 0:
-            models.mark_notes_synced(note_ids)
-
-        return synced
+        return self._sync(['notes'])['notes']
 
     def sync_deals(self):
         """Sync unsynced deals to Google Sheets.
@@ -240,40 +294,7 @@ class SheetsSync:
         Returns:
             Number of deals synced.
         """
-        deals = models.get_unsynced_deals()
-
-        if not deals:
-            return 0
-
-        # Set up headers
-        headers = ['Account', 'Deal Name', 'Stage', 'Value', 'Products', 'Expected Close', 'Notes', 'Created', 'Closed']
-        self._setup_headers('Deals', headers)
-
-        # Prepare rows
-        rows = []
-        deal_ids = []
-
-        for deal in deals:
-            rows.append([
-                to_str(deal['account_name']),
-                to_str(deal['name']),
-                to_str(deal['stage']),
-                to_str(deal['value']),
-                to_str(deal['products']),
-                to_str(deal['expected_close_date']),
-                to_str(deal['notes']),
-                to_str(deal['created_at']),
-                to_str(deal['closed_at'])
-            ])
-            deal_ids.append(deal['id'])
-
-        # Append to sheet
-        synced = self._append_rows('Deals', rows)
-
-        if synced > 0:
-            models.mark_deals_synced(deal_ids)
-
-        return synced
+        return self._sync(['deals'])['deals']
 
     def full_sync(self):
         """Perform a full sync of all unsynced data.
@@ -281,17 +302,14 @@ class SheetsSync:
         Returns:
             Dictionary with sync results.
         """
-        activities_synced = self.sync_activities()
-        tasks_synced = self.sync_tasks()
-        notes_synced = self.sync_notes()
-        deals_synced = self.sync_deals()
+        synced = self._sync(list(_SHEETS))
 
         return {
             'success': True,
-            'activities_synced': activities_synced,
-            'tasks_synced': tasks_synced,
-            'notes_synced': notes_synced,
-            'deals_synced': deals_synced,
-            'total_synced': activities_synced + tasks_synced + notes_synced + deals_synced,
+            'activities_synced': synced['activities'],
+            'tasks_synced': synced['tasks'],
+            'notes_synced': synced['notes'],
+            'deals_synced': synced['deals'],
+            'total_synced': sum(synced.values()),
             'synced_at': datetime.now().isoformat()
         }
@@ -61,12 +61,14 @@ const API = {
     },
 
     dashboard: {
-        getStats: () => API.request('/dashboard')
+        getStats: () => API.request('/dashboard'),
+        getBundle: () => API.request('/dashboard/bundle')
     },
 
     sync: {
         getStatus: () => API.request('/sync/status'),
-        run: () => API.request('/sync', { method: 'POST' })
+        run: () => API.request('/sync', { method: 'POST' }),
+        getResult: () => API.request('/sync/result')
     }
 };
 
@@ -188,23 +190,17 @@ const Modal = {
 // Dashboard Stats Bar
 // ============================================================================
 
-async function loadDashboard() {
-    try {
-        const stats = await API.dashboard.getStats();
-
-        document.getElementById('stat-weekly').textContent =
-            `${stats.weekly_touches}/${stats.total_accounts}`;
-        document.getElementById('stat-pipeline').textContent =
-            formatMoney(stats.total_pipeline);
-        document.getElementById('stat-renewals').textContent =
-            stats.upcoming_renewals;
-        document.getElementById('stat-overdue').textContent =
-            stats.overdue_tasks;
-        document.getElementById('stat-streak').textContent =
-            stats.touch_streak > 0 ? `🔥 ${stats.touch_streak}d` : '0d';
-    } catch (error) {
-        console.error('Failed to load dashboard:', error);
-    }
+function renderDashboard(stats) {
+    document.getElementById('stat-weekly').textContent =
+        `${stats.weekly_touches}/${stats.total_accounts}`;
+    document.getElementById('stat-pipeline').textContent =
+        formatMoney(stats.total_pipeline);
+    document.getElementById('stat-renewals').textContent =
+        stats.upcoming_renewals;
+    document.getElementById('stat-overdue').textContent =
+        stats.overdue_tasks;
+    document.getElementById('stat-streak').textContent =
+        stats.touch_streak > 0 ? `🔥 ${stats.touch_streak}d` : '0d';
 }
 
 // ============================================================================
@@ -741,7 +737,6 @@ async function handleAccountEditSubmit(e) {
         Modal.close('account-edit-modal');
         showToast('Account updated ✓');
         await loadAccounts();
-        await loadDashboard();
     } catch (error) {
         showToast('Failed: ' + error.message);
     }
@@ -785,19 +780,22 @@ async function handleQuickLog(accountId, activityType, description) {
 
 async function updateSyncStatus() {
     try {
-        const status = await API.sync.getStatus();
-        const badge = document.getElementById('unsynced-badge');
-        if (status.total_unsynced > 0) {
-            badge.textContent = status.total_unsynced;
-            badge.classList.remove('hidden');
-        } else {
-            badge.classList.add('hidden');
-        }
+        renderSyncStatus(await API.sync.getStatus());
     } catch (error) {
         console.error('Failed to get sync status:', error);
     }
 }
 
+function renderSyncStatus(status) {
+    const badge = document.getElementById('unsynced-badge');
+    if (status.total_unsynced > 0) {
+        badge.textContent = status.total_unsynced;
+        badge.classList.remove('hidden');
+    } else {
+        badge.classList.add('hidden');
+    }
+}
+
 async function handleSync() {
     const btn = document.getElementById('sync-btn');
     btn.disabled = true;
@@ -805,6 +803,14 @@ async function handleSync() {
 
     try {
         await API.sync.run();
+        let result = await API.sync.getResult();
+        while (result.running) {
+            await new Promise(resolve => setTimeout(resolve, 1000));
+            result = await API.sync.getResult();
+        }
+        if (result.last_error) {
+            throw new Error(result.last_error);
+        }
         showToast('Sync completed ✓');
         await updateSyncStatus();
     } catch (error) {
@@ -1140,7 +1146,6 @@ function setupEventListeners() {
                     await API.deals.delete(dealId);
                     await loadAccountDeals(State.currentAccountId);
                     await loadAccounts();
-                    await loadDashboard();
                     showToast('Deal deleted');
                 } catch (error) {
                     showToast('Failed to delete deal');
@@ -1208,11 +1213,13 @@ async function loadAccounts() {
     loading.classList.remove('hidden');
 
     try {
-        const data = await API.accounts.getAll();
+        // One request (and one DB connection) for everything the page shows
+        const data = await API.dashboard.getBundle();
         State.accounts = data.accounts;
         renderAccounts();
         updateProgress();
-        await loadDashboard();
+        renderDashboard(data.dashboard);
+        renderSyncStatus(data.sync_status);
     } catch (error) {
         showToast('Failed to load accounts: ' + error.message);
     } finally {
@@ -1242,11 +1249,8 @@ async function init() {
     // Setup event listeners
     setupEventListeners();
 
-    // Load accounts and dashboard
+    // Load accounts, dashboard and sync status
     await loadAccounts();
-
-    // Update sync status
-    await updateSyncStatus();
 }
 
 // Start the app